@@ -65,6 +65,30 @@ class SslConfigAdmin(admin.ModelAdmin):
                 'https_redirects'
             ),
         }),
+        ('Connection options', {
+            'classes': ('collapse',),
+            'fields': (
+                'egress_proxy',
+                'timeout_connect',
+                'timeout_read',
+                'timeout_total',
+                'tcp_nodelay',
+                'tcp_keepalive',
+                'tcp_keepalive_idle',
+                'tcp_keepalive_interval',
+                'tcp_keepalive_count',
+                'socket_send_buffer',
+                'socket_recv_buffer',
+                'hedge_requests',
+                'hedge_percentile',
+                'hedge_budget',
+                'max_concurrent',
+                'queue_size',
+                'queue_timeout',
+                'compress_level',
+                'compress_min_size',
+            ),
+        }),
     )
 
     def changeform_view(self, request, object_id=None, form_url='',
@@ -111,7 +135,7 @@ class HostnamePortSslConfigAdminForm(forms.ModelForm):
 
 class HostnamePortSslConfigAdmin(OrderedModelAdmin):
     list_display = ('enabled', 'hostname_port',
-                    'ssl_config', 'proxy', 'move_up_down_links')
+                    'ssl_config', 'proxy', 'cache_ttl', 'move_up_down_links')
     list_display_links = ('hostname_port', 'ssl_config',)
     list_filter = ('enabled', 'proxy',)
     # list_editable = ('enabled',)
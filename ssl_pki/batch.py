@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+
+import json
+import base64
+import logging
+
+from urllib import urlencode
+# noinspection PyCompatibility
+from urlparse import parse_qsl, urlsplit, urlunsplit
+from wsgiref import util as wsgiref_util
+
+from .settings import BATCH_MAX_ITEMS, BATCH_ITEM_MAX_SIZE, STREAM_CHUNK_SIZE
+from .utils import pki_route_reverse
+
+
+logger = logging.getLogger(__name__)
+
+# Methods of batched requests; bodies are not supported
+BATCH_METHODS = ('GET', 'HEAD')
+
+# Request headers a batched request may send upstream
+BATCH_ITEM_HEADERS = ('Accept', 'Accept-Language', 'Cache-Control',
+                      'If-None-Match', 'If-Modified-Since', 'Range',
+                      'If-Range')
+
+# Allowed header names, by their lowercase, as header names are
+# case-insensitive
+_ITEM_HEADERS = dict([(h.lower(), h) for h in BATCH_ITEM_HEADERS])
+
+# Response headers not relayed, as bodies are decoded and re-encoded (but for
+# partial content, which is relayed as is)
+_SKIP_HEADERS = ('content-encoding', 'content-length')
+
+
+class BatchError(Exception):
+    """A batch request is invalid as a whole"""
+
+
+class BatchItemTooLarge(Exception):
+    """A batched response body exceeded its maximum size"""
+
+
+def strip_access_token(query_str):
+    """
+    Strip our bearer token from query params, keeping keys with empty values
+    and their order
+    :rtype: str
+    """
+    params = parse_qsl(query_str.strip(), keep_blank_values=True)
+    clean_params = [(k, v) for k, v in params if k.lower() != 'access_token']
+    return urlencode(clean_params, doseq=True)
+
+
+def upstream_url(url):
+    """
+    :param url: Resource URL, as https URL, hostname[:port]/path, or routed
+        through /pki/ (see utils.pki_route)
+    :return: https URL, without access_token query params, or None if invalid
+    :rtype: str | None
+    """
+    url = pki_route_reverse(url)
+    if '://' not in url:
+        url = 'https://' + url.lstrip('/')
+    scheme, netloc, path, query, _ = urlsplit(url)
+    if scheme.lower() != 'https' or not netloc:
+        return None
+    if query:
+        query = strip_access_token(query)
+    return urlunsplit(('https', netloc, path or '/', query, ''))
+
+
+def parse_batch(body, max_items=None):
+    """
+    :param body: JSON list of resource URLs, or of objects with a 'url' and
+        optional 'method' (GET or HEAD) and 'headers'
+    :return: Items, as dicts of 'url', 'method' and 'headers', plus an
+        'error' if the item is invalid
+    :rtype: list[dict]
+    :raises BatchError: If body is not a JSON list, or too long
+    """
+    if max_items is None:
+        max_items = BATCH_MAX_ITEMS
+    try:
+        items = json.loads(body)
+    except ValueError:
+        raise BatchError('Request body is not valid JSON')
+    if not isinstance(items, list):
+        raise BatchError('Request body must be a JSON list of resources')
+    if len(items) > max_items:
+        raise BatchError('Too many resources in batch: {0} (max {1})'
+                         .format(len(items), max_items))
+    return [_batch_item(item) for item in items]
+
+
+def _batch_item(item):
+    if isinstance(item, basestring):  # noqa
+        item = {'url': item}
+    if not isinstance(item, dict) or \
+            not isinstance(item.get('url'), basestring):  # noqa
+        return {'url': None, 'method': None, 'headers': {},
+                'error': 'Resource must be a URL, or an object with a "url"'}
+    method = unicode(item.get('method') or 'GET').upper()  # noqa
+    headers = item.get('headers') or {}
+    headers = dict([(_ITEM_HEADERS[h.lower()], v) for h, v in headers.items()
+                    if isinstance(h, basestring) and  # noqa
+                    h.lower() in _ITEM_HEADERS]) \
+        if isinstance(headers, dict) else {}
+    if 'Range' in headers:
+        # Ranges are of the encoded body, which could not be decoded
+        headers['Accept-Encoding'] = 'identity'
+    parsed = {
+        'url': upstream_url(item['url']),
+        'method': str(method),
+        'headers': headers,
+    }
+    if parsed['url'] is None:
+        parsed['error'] = 'Not an https resource URL: {0}'.format(item['url'])
+    elif method not in BATCH_METHODS:
+        parsed['error'] = 'Method not allowed in batch: {0}'.format(method)
+    return parsed
+
+
+def read_body(response, max_size=None):
+    """
+    Read a streamed response's (decoded) body, e.g. as a fan-out's process.
+    Partial content is read as is, as its range is of the encoded body.
+    :type response: requests.Response
+    :return: Response, and its body
+    :rtype: (requests.Response, bytes)
+    :raises BatchItemTooLarge: If body exceeds max size
+    """
+    if max_size is None:
+        max_size = BATCH_ITEM_MAX_SIZE
+    chunks = []
+    size = 0
+    if response.status_code == 206:
+        body = response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+    else:
+        body = response.iter_content(STREAM_CHUNK_SIZE)
+    try:
+        for chunk in body:
+            size += len(chunk)
+            if size > max_size:
+                raise BatchItemTooLarge(
+                    'Response body larger than {0} bytes'.format(max_size))
+            chunks.append(chunk)
+    finally:
+        response.close()
+    return response, b''.join(chunks)
+
+
+def item_record(index, item, status=None, error=None):
+    """
+    Batch result of an item without an upstream response
+    :rtype: dict
+    """
+    return {
+        'index': index,
+        'url': item['url'],
+        'method': item['method'],
+        'status': status,
+        'error': error,
+    }
+
+
+def response_record(index, item, response, content, elapsed=None):
+    """
+    Batch result of an item's upstream response; textual bodies are included
+    as is, others base64 encoded
+    :type response: requests.Response
+    :rtype: dict
+    """
+    record = item_record(index, item, status=response.status_code)
+    record['reason'] = response.reason
+    record['elapsed'] = elapsed
+    skip_headers = _SKIP_HEADERS if response.status_code != 206 else ()
+    record['headers'] = dict([
+        (h, v) for h, v in response.headers.items()
+        if h.lower() not in skip_headers and
+        not wsgiref_util.is_hop_by_hop(h)])
+    if item['method'] == 'HEAD':
+        return record
+    content_type = response.headers.get('Content-Type', '').lower()
+    if any([t in content_type for t in ['text', 'json', 'xml']]):
+        try:
+            record['body'] = content.decode(response.encoding or 'utf-8')
+            return record
+        except (LookupError, UnicodeDecodeError):
+            pass
+    record['body_base64'] = base64.b64encode(content)
+    return record
+
+
+def ndjson(record):
+    """:rtype: bytes"""
+    return json.dumps(record, separators=(',', ':')) + b'\n'
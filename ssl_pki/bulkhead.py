@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+
+import time
+import logging
+import threading
+
+from collections import deque
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class BulkheadFull(Exception):
+    """
+    A request was refused a slot, as its upstream's queue is full, or it
+    waited in the queue too long
+    """
+    def __init__(self, message, timed_out=False):
+        super(BulkheadFull, self).__init__(message)
+        self.timed_out = timed_out
+
+
+class Bulkhead(object):
+    """
+    Limit on concurrent requests to one upstream, with a bounded queue of
+    waiting requests, so a slow upstream can not hold every worker thread.
+    Freed slots are handed to queued requests first, in arrival order, so
+    newly arriving requests can not starve them.
+
+    :param max_concurrent: Most requests in flight at once
+    :param queue_size: Most requests waiting for a slot; others are refused
+        at once
+    :param queue_timeout: Longest wait for a slot, in seconds; None for no
+        limit (other than any passed to :meth:`acquire`)
+    """
+    def __init__(self, max_concurrent, queue_size=0, queue_timeout=None):
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.reset()
+
+    def reset(self):
+        """Reset lock and gauges, e.g. in a forked worker"""
+        self._lock = threading.Lock()
+        # Events of queued requests, set when handed a slot
+        self._waiters = deque()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def acquire(self, timeout=None):
+        """
+        Take a slot, waiting in the queue if needed; :meth:`release` it once
+        the request's response is done
+        :param timeout: Seconds, if shorter than the queue timeout
+        :raises BulkheadFull: If the queue is full, or waiting timed out
+        """
+        if self.queue_timeout is not None and (
+                timeout is None or timeout > self.queue_timeout):
+            timeout = self.queue_timeout
+        with self._lock:
+            if self.in_flight < self.max_concurrent and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            if self.queued >= self.queue_size or timeout == 0:
+                self.rejected += 1
+                raise BulkheadFull(
+                    '{0} requests in flight, {1} queued'
+                    .format(self.in_flight, self.queued))
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            self.queued += 1
+        if waiter.wait(timeout):
+            return
+        with self._lock:
+            if waiter.is_set():
+                # Handed a slot just as the wait timed out
+                return
+            self._waiters.remove(waiter)
+            self.queued -= 1
+            self.timeouts += 1
+        raise BulkheadFull('No slot free within {0:.3f}s'.format(timeout),
+                           timed_out=True)
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """
+        Hold a slot for the duration of a with block; see :meth:`acquire`
+        :raises BulkheadFull: If the queue is full, or waiting timed out
+        """
+        self.acquire(timeout=timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the slot over, still in flight, to the longest waiting
+                self._waiters.popleft().set()
+                self.queued -= 1
+                self.admitted += 1
+            elif self.in_flight > 0:
+                self.in_flight -= 1
+
+    def stats(self):
+        """:rtype: dict"""
+        return {
+            'max_concurrent': self.max_concurrent,
+            'queue_size': self.queue_size,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+import logging
+import threading
+
+from collections import OrderedDict
+from email.utils import parsedate_tz, mktime_tz
+
+from .settings import (
+    RESPONSE_CACHE_MAX_SIZE,
+    RESPONSE_CACHE_MAX_ENTRY_SIZE,
+    RESPONSE_CACHE_DEFAULT_TTL,
+)
+from .utils import normalize_hostname
+
+
+logger = logging.getLogger(__name__)
+
+# Response statuses that may be stored, given explicit freshness (or a TTL)
+CACHEABLE_STATUSES = (200, 203, 404, 410)
+
+# Headers of a stored response that a 304 Not Modified does not update
+_KEEP_ON_REVALIDATION = ('content-length', 'content-type', 'content-encoding',
+                         'content-range', 'transfer-encoding', 'connection',
+                         'keep-alive', 'age')
+
+
+def header_value(headers, name, default=None):
+    """
+    Case-insensitive header lookup, for plain dicts of headers
+    :type headers: dict
+    :rtype: str | None
+    """
+    if headers is None:
+        return default
+    value = headers.get(name, None)
+    if value is not None:
+        return value
+    name = name.lower()
+    for h, v in headers.items():
+        if h.lower() == name:
+            return v
+    return default
+
+
+def parse_cache_control(value):
+    """
+    :param value: Cache-Control header value, e.g. 'public, max-age=60'
+    :return: Lowercased directives, mapped to their value, or True if valueless
+    :rtype: dict
+    """
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, val = part.strip().partition('=')
+        name = name.strip().lower()
+        if name:
+            directives[name] = val.strip().strip('"') if val else True
+    return directives
+
+
+def _seconds(value):
+    """Delta-seconds directive value, or None if invalid"""
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def http_date(value):
+    """
+    :param value: HTTP-date header value, e.g. of Expires
+    :return: Timestamp, or None if missing or invalid
+    :rtype: float | None
+    """
+    if not value:
+        return None
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    try:
+        return float(mktime_tz(parsed))
+    except (OverflowError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers, ttl=None, default_ttl=None):
+    """
+    How long an upstream response may be served from the cache, per its
+    Cache-Control and Expires headers (s-maxage, then max-age, then Expires).
+    :param headers: Upstream response headers, as a dict or (header, value)
+        pairs
+    :param ttl: Per-mapping override, in seconds, if any
+    :param default_ttl: Seconds for responses without explicit freshness
+    :return: Seconds, or None if the response must not be stored
+    :rtype: int | float | None
+    """
+    if hasattr(headers, 'items'):
+        headers = headers.items()
+    headers = dict([(h.lower(), v) for h, v in headers])
+    cc = parse_cache_control(headers.get('cache-control'))
+    # Shared cache: never store per-user or cookie-setting responses
+    if 'no-store' in cc or 'private' in cc or 'set-cookie' in headers:
+        return None
+    if headers.get('vary', '').strip() == '*':
+        return None
+    if ttl is not None:
+        return ttl
+    if 'no-cache' in cc:
+        return 0
+    for directive in ('s-maxage', 'max-age'):
+        if directive in cc:
+            seconds = _seconds(cc[directive])
+            if seconds is not None:
+                return seconds
+    if 'expires' in headers:
+        expires = http_date(headers['expires'])
+        if expires is None:
+            return 0  # invalid, e.g. '0', means already expired
+        date = http_date(headers.get('date')) or time.time()
+        return max(0, expires - date)
+    if default_ttl is None:
+        default_ttl = RESPONSE_CACHE_DEFAULT_TTL
+    return default_ttl
+
+
+def vary_names(value):
+    """
+    :param value: Vary response header value, e.g. 'Accept-Encoding'
+    :return: Sorted, lowercased header names
+    :rtype: tuple
+    """
+    return tuple(sorted(set([h.strip().lower()
+                             for h in (value or '').split(',')
+                             if h.strip()])))
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match request header to an ETag
+    :rtype: bool
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+
+    return opaque(etag) in [opaque(t) for t in if_none_match.split(',')]
+
+
+class CachedResponse(object):
+    """
+    A stored upstream response, as relayed to the client by /pki/
+    :param headers: List of (header, value) pairs
+    :param lifetime: Seconds the response is fresh for, from its age of 0
+    :param age: Age of the response when stored (per upstream Age header)
+    """
+    __slots__ = ('status', 'reason', 'headers', 'content', 'stored',
+                 'lifetime', 'initial_age', 'vary', 'ssl_config_id', 'size')
+
+    def __init__(self, status, reason, headers, content, lifetime,
+                 age=0, vary=(), ssl_config_id=None, now=None):
+        self.status = status
+        self.reason = reason
+        self.headers = list(headers)
+        self.content = content
+        self.stored = now or time.time()
+        self.lifetime = lifetime
+        self.initial_age = age
+        self.vary = tuple(vary)
+        self.ssl_config_id = ssl_config_id
+        self.size = len(content) + sum([len(h) + len(v)
+                                        for h, v in self.headers])
+
+    def header(self, name, default=None):
+        name = name.lower()
+        for h, v in self.headers:
+            if h.lower() == name:
+                return v
+        return default
+
+    @property
+    def etag(self):
+        return self.header('ETag')
+
+    @property
+    def last_modified(self):
+        return self.header('Last-Modified')
+
+    def validators(self):
+        """
+        Conditional request headers, to revalidate the response upstream
+        :rtype: dict
+        """
+        validators = {}
+        if self.etag:
+            validators['If-None-Match'] = self.etag
+        if self.last_modified:
+            validators['If-Modified-Since'] = self.last_modified
+        return validators
+
+    def not_modified(self, if_none_match=None, if_modified_since=None):
+        """
+        Whether a client's conditional request headers match the response,
+        i.e. it can be answered with a 304 Not Modified
+        :rtype: bool
+        """
+        if self.status != 200:
+            return False
+        if if_none_match:
+            # If-Modified-Since is ignored when If-None-Match is present
+            return etag_matches(if_none_match, self.etag)
+        since = http_date(if_modified_since)
+        modified = http_date(self.last_modified)
+        return since is not None and modified is not None and \
+            modified <= since
+
+    def revalidated(self, headers, lifetime, age=0, now=None):
+        """
+        Copy of the response, updated by the headers of a 304 Not Modified
+        :param headers: 304 response headers
+        :rtype: CachedResponse
+        """
+        updates = OrderedDict([(h.lower(), (h, v)) for h, v in headers
+                               if h.lower() not in _KEEP_ON_REVALIDATION])
+        merged = []
+        for h, v in self.headers:
+            merged.append(updates.pop(h.lower(), (h, v)))
+        merged.extend(updates.values())
+        return CachedResponse(self.status, self.reason, merged, self.content,
+                              lifetime, age=age, vary=self.vary,
+                              ssl_config_id=self.ssl_config_id, now=now)
+
+    def age(self, now=None):
+        return self.initial_age + max(0, (now or time.time()) - self.stored)
+
+    def is_fresh(self, now=None):
+        return self.age(now) < self.lifetime
+
+
+class ResponseCache(object):
+    """
+    Memory-bounded, least-recently-used cache of upstream responses.
+
+    Entries are keyed by normalized upstream URL and SslConfig (see
+    :meth:`primary_key`), plus the request's values of any headers named by
+    the cached response's Vary header.
+
+    :param max_size: Bound on the total size of entries, in bytes; 0 disables
+        the cache
+    :param max_entry_size: Largest single entry stored, in bytes
+    """
+    def __init__(self, max_size=RESPONSE_CACHE_MAX_SIZE,
+                 max_entry_size=RESPONSE_CACHE_MAX_ENTRY_SIZE):
+        self.max_size = max_size
+        self.max_entry_size = min(max_entry_size, max_size)
+        self._lock = threading.RLock()
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.revalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def reset_lock(self):
+        """Replace lock, e.g. in a forked worker, if held at fork time"""
+        self._lock = threading.RLock()
+
+    def clear(self):
+        with self._lock:
+            # (primary key, Vary values) -> CachedResponse, oldest first
+            self._entries = OrderedDict()
+            # primary key -> lowercased header names of stored Vary
+            self._vary = {}
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def primary_key(url, ssl_config_id=None):
+        """
+        :param url: Upstream URL, or ParsedUrl
+        :param ssl_config_id: Primary key of the URL's SslConfig, if any
+        :rtype: tuple
+        """
+        return normalize_hostname(url), ssl_config_id
+
+    def _key(self, primary, headers, vary=None):
+        if vary is None:
+            vary = self._vary.get(primary, ())
+        return primary, tuple([header_value(headers, h) for h in vary])
+
+    def lookup(self, primary, headers, now=None):
+        """
+        :param primary: Key from :meth:`primary_key`
+        :param headers: Request headers sent upstream
+        :return: Cached response, if any; if stale, it has validators and
+            should be revalidated upstream before use
+        :rtype: CachedResponse | None
+        """
+        with self._lock:
+            key = self._key(primary, headers)
+            entry = self._entries.get(key, None)
+            if entry is not None and not entry.is_fresh(now) and \
+                    not entry.validators():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = self._entries.pop(key)  # most recently used
+            if entry.is_fresh(now):
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def store(self, primary, headers, entry):
+        """
+        Store a response, unless it is too large, or already stale without
+        any validators to revalidate it with
+        :param headers: Request headers sent upstream, for Vary matching
+        :type entry: CachedResponse
+        :rtype: bool
+        """
+        if not self.enabled or entry.size > self.max_entry_size or \
+                not (entry.is_fresh() or entry.validators()):
+            return False
+        with self._lock:
+            if self._vary.get(primary, ()) != entry.vary:
+                # Variants stored under other Vary headers are unreachable
+                self._remove_primary(primary)
+                self._vary[primary] = entry.vary
+            key = self._key(primary, headers, entry.vary)
+            self._remove(key)
+            self._entries[key] = entry
+            self.size += entry.size
+            self.stores += 1
+            while self.size > self.max_size and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def revalidate(self, primary, headers, entry, response_headers,
+                   ttl=None, age=0):
+        """
+        Refresh a stale entry that upstream answered with a 304 Not Modified
+        :param headers: Request headers sent upstream, for Vary matching
+        :param response_headers: 304 response headers, as (header, value)
+            pairs
+        :param ttl: Per-mapping TTL override, if any
+        :return: Refreshed entry
+        :rtype: CachedResponse
+        """
+        response_headers = list(response_headers)
+        refreshed = entry.revalidated(response_headers, 0)
+        lifetime = freshness_lifetime(refreshed.headers, ttl=ttl)
+        with self._lock:
+            self.revalidations += 1
+            if lifetime is None:
+                # No longer storable, e.g. now marked private
+                self._remove(self._key(primary, headers, entry.vary))
+                return refreshed
+        refreshed = entry.revalidated(response_headers, lifetime, age=age)
+        self.store(primary, headers, refreshed)
+        return refreshed
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+        return entry
+
+    def _remove_primary(self, primary):
+        for key in [k for k in self._entries if k[0] == primary]:
+            self._remove(key)
+
+    def invalidate(self, ssl_config_id=None):
+        """
+        Drop entries, e.g. when mappings or SslConfigs change
+        :param ssl_config_id: Only drop entries fetched with this SslConfig
+        :return: Number of entries dropped
+        :rtype: int
+        """
+        with self._lock:
+            if ssl_config_id is None:
+                dropped = len(self._entries)
+                self.clear()
+            else:
+                keys = [k for k, e in self._entries.items()
+                        if e.ssl_config_id == ssl_config_id]
+                for key in keys:
+                    self._remove(key)
+                dropped = len(keys)
+        if dropped:
+            logger.debug(u'Response cache invalidated {0} entries'
+                         .format(dropped))
+        return dropped
+
+    def stats(self):
+        """:rtype: dict"""
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'revalidations': self.revalidations,
+        }
+
+
+# global, as /pki/ requests for the same resources come from all clients
+response_cache = ResponseCache()
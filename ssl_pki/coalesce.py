@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+
+import logging
+import threading
+
+from .settings import COALESCE_TIMEOUT
+
+
+logger = logging.getLogger(__name__)
+
+
+class Flight(object):
+    """
+    One in-progress upstream fetch, awaited by identical concurrent requests
+    """
+    __slots__ = ('key', 'result', 'followers', '_done')
+
+    def __init__(self, key):
+        self.key = key
+        # Shareable result, e.g. a CachedResponse, once done
+        self.result = None
+        self.followers = 0
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+
+class SingleFlight(object):
+    """
+    Coalescing of identical concurrent upstream requests.
+
+    The first caller of a key (the leader) fetches; callers joining while its
+    flight is in progress (followers) wait for its result instead. A leader
+    always finishes its flight, with a shareable result, or without one
+    (upon an error, a timeout, or a response that is not shareable, e.g.
+    streamed). Followers then fetch for themselves, as they also do if the
+    wait times out, so a failing or slow leader only costs them the wait.
+
+    :param timeout: Longest wait of followers, in seconds; 0 disables
+        coalescing
+    """
+    def __init__(self, timeout=COALESCE_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # key -> Flight in progress
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+        self.shared = 0
+        self.fallbacks = 0
+        self.timeouts = 0
+
+    @property
+    def enabled(self):
+        return self.timeout > 0
+
+    def reset_lock(self):
+        """
+        Replace lock, e.g. in a forked worker, if held at fork time, and
+        forget flights led by the parent's threads, which never finish here
+        """
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    def join(self, key):
+        """
+        :param key: Hashable key of identical requests
+        :return: Flight, and whether the caller leads it. Leaders must
+            :meth:`finish` it, e.g. in a finally clause.
+        :rtype: (Flight, bool)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight(key)
+                self.leaders += 1
+                return flight, True
+            flight.followers += 1
+            self.followers += 1
+            return flight, False
+
+    def finish(self, flight):
+        """
+        End a led flight, waking its followers. Its leader sets any shareable
+        result beforehand, as its ``result``; otherwise followers fetch.
+        """
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                # Later callers start a new flight
+                del self._flights[flight.key]
+        flight._done.set()
+
+    def wait(self, flight, timeout=None):
+        """
+        Wait for a followed flight's result
+        :param timeout: Seconds, if shorter than the configured timeout
+        :return: Leader's shareable result, or None if there is none, or
+            waiting timed out
+        """
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        flight._done.wait(max(timeout, 0))
+        with self._lock:
+            if not flight.done:
+                self.timeouts += 1
+                return None
+            if flight.result is None:
+                self.fallbacks += 1
+                return None
+            self.shared += 1
+            return flight.result
+
+    def stats(self):
+        """:rtype: dict"""
+        requests = self.leaders + self.followers
+        return {
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'shared': self.shared,
+            'fallbacks': self.fallbacks,
+            'timeouts': self.timeouts,
+            # Fraction of coalescable requests served by another's fetch
+            'rate': float(self.shared) / requests if requests else 0.0,
+        }
+
+
+# global, as identical /pki/ requests come from all clients
+coalescer = SingleFlight()
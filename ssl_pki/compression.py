@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+
+import zlib
+import logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .settings import COMPRESS_LEVEL, COMPRESS_MIN_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# Content types worth compressing, as substrings of a Content-Type
+COMPRESSIBLE_TYPES = ('text/', 'json', 'xml', 'javascript', 'ecmascript',
+                      'csv', 'svg', 'wkt')
+
+# Statuses of responses that may be compressed; never partial content
+COMPRESSIBLE_STATUSES = (200, 203)
+
+# Supported codings, most preferred first
+_ENCODINGS = ['br', 'gzip'] if brotli is not None and \
+    hasattr(brotli, 'Compressor') else ['gzip']
+
+
+def compressible(content_type):
+    """:rtype: bool"""
+    content_type = (content_type or '').lower()
+    return any([t in content_type for t in COMPRESSIBLE_TYPES])
+
+
+def accepted_encoding(accept_encoding):
+    """
+    Most preferred supported coding a client accepts
+    :param accept_encoding: Client's Accept-Encoding header value
+    :return: 'br', 'gzip' or None
+    :rtype: str | None
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[coding.strip()] = q
+    best = None
+    for coding in _ENCODINGS:
+        q = qualities.get(coding, qualities.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best is not None else None
+
+
+def compression_settings(level=None, min_size=None):
+    """
+    :param level: Mapped SslConfig's compression level, if set
+    :param min_size: Mapped SslConfig's minimum size, if set
+    :return: Level (0 disables compression) and minimum size, in bytes,
+        falling back to the global settings
+    :rtype: (int, int)
+    """
+    return (COMPRESS_LEVEL if level is None else level,
+            COMPRESS_MIN_SIZE if min_size is None else min_size)
+
+
+def _compressor(encoding, level):
+    """:return: Callables to process a chunk, sync flush and finish"""
+    if encoding == 'br':
+        # Brotli quality ranges 0-11; gzip levels 1-9 map onto it as is
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return (compressor.compress,
+            lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush)
+
+
+def compress(content, encoding, level):
+    """
+    :param encoding: 'br' or 'gzip'
+    :rtype: bytes
+    """
+    process, _, finish = _compressor(encoding, level)
+    return process(content) + finish()
+
+
+class CompressedBody(object):
+    """
+    Iterable compressing another iterable's chunks as they are relayed, e.g.
+    a StreamingHttpResponse's content. Each chunk is flushed, so it reaches
+    the client without waiting for the next, e.g. for a slow upstream.
+
+    The stream's trailer is only written once the chunks are exhausted;
+    errors they raise, e.g. an UpstreamBodyIncomplete, propagate without it,
+    so a truncated body can't pass for a complete compressed stream.
+
+    :param chunks: Iterable of bytes, e.g. an UpstreamBody
+    :param encoding: 'br' or 'gzip'
+    :param level: Compression level
+    """
+    def __init__(self, chunks, encoding, level):
+        self.chunks = chunks
+        self.encoding = encoding
+        self.level = level
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __iter__(self):
+        process, flush, finish = _compressor(self.encoding, self.level)
+        for chunk in self.chunks:
+            self.bytes_in += len(chunk)
+            if not chunk:
+                continue
+            # Output may be just a header, with the chunk itself buffered
+            data = process(chunk) + flush()
+            if data:
+                self.bytes_out += len(data)
+                yield data
+        # Only reached when chunks are exhausted, not upon their errors
+        data = finish()
+        self.bytes_out += len(data)
+        yield data
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+import logging
+import threading
+
+from collections import deque
+# noinspection PyCompatibility
+from Queue import Queue, Empty
+
+from .settings import HEDGE_WINDOW, HEDGE_MIN_SAMPLES
+
+
+logger = logging.getLogger(__name__)
+
+
+class HedgePolicy(object):
+    """
+    When to hedge an upstream request, i.e. send a second attempt if the first
+    has not returned response headers within a percentile of recent response
+    times, and counters of how hedging fares.
+
+    :param percentile: Percentile (of recent response times) to wait before
+        hedging, e.g. 95
+    :param budget: Maximum percent of requests that may be hedged
+    :param window: Number of recent response times kept
+    :param min_samples: Response times needed before any hedging
+    """
+    def __init__(self, percentile, budget, window=HEDGE_WINDOW,
+                 min_samples=HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+    def reset_lock(self):
+        """Replace lock, e.g. in a forked worker, if held at fork time"""
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        """Record seconds an attempt took to return response headers"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def start(self):
+        """
+        Count a hedgeable request
+        :return: Seconds to wait before hedging it, or None to not hedge
+        :rtype: float | None
+        """
+        with self._lock:
+            self.requests += 1
+            if len(self._latencies) < self.min_samples:
+                return None
+            if not self._within_budget():
+                return None
+            latencies = sorted(self._latencies)
+        index = int(round((len(latencies) - 1) * self.percentile / 100.0))
+        return latencies[index]
+
+    def _within_budget(self):
+        return (self.hedges_issued + 1) * 100 <= self.budget * self.requests
+
+    def acquire_hedge(self):
+        """
+        Count a hedge about to be issued, if still within budget
+        :rtype: bool
+        """
+        with self._lock:
+            if not self._within_budget():
+                return False
+            self.hedges_issued += 1
+            return True
+
+    def hedge_won(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def stats(self):
+        """:rtype: dict"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        delay = None
+        if len(latencies) >= self.min_samples:
+            delay = latencies[int(round(
+                (len(latencies) - 1) * self.percentile / 100.0))]
+        return {
+            'percentile': self.percentile,
+            'budget': self.budget,
+            'delay': delay,
+            'samples': len(latencies),
+            'requests': self.requests,
+            'hedges_issued': self.hedges_issued,
+            'hedges_won': self.hedges_won,
+        }
+
+
+def send_hedged(policy, send, request, **kwargs):
+    """
+    Send a request, hedging it with a second attempt (on another pooled
+    connection) if it is slow to return response headers. The first
+    successful response wins; the other attempt's response is closed, as soon
+    as it returns, so its connection is not reused mid-response.
+
+    Only for idempotent requests without a streamed body.
+
+    :param policy: HedgePolicy of the upstream
+    :param send: Callable of (request, **kwargs) returning a response, e.g.
+        HTTPAdapter.send, bound
+    :type request: requests.PreparedRequest
+    :rtype: requests.Response
+    """
+    delay = policy.start()
+    if delay is None:
+        start = time.time()
+        resp = send(request, **kwargs)
+        policy.record(time.time() - start)
+        return resp
+
+    results = Queue()
+    lock = threading.Lock()
+    state = {'done': False}
+
+    def attempt(index, req):
+        start = time.time()
+        try:
+            resp, err = send(req, **kwargs), None
+            policy.record(time.time() - start)
+        except Exception as e:
+            resp, err = None, e
+        with lock:
+            if state['done']:
+                if resp is not None:
+                    resp.close()  # lost the race
+                return
+            results.put((index, resp, err))
+
+    def start_attempt(index, req):
+        t = threading.Thread(target=attempt, args=(index, req),
+                             name='ssl_pki-hedge-{0}'.format(index))
+        t.daemon = True
+        t.start()
+
+    start_attempt(0, request)
+    pending = 1
+    try:
+        item = results.get(timeout=delay)
+    except Empty:
+        item = None
+        if policy.acquire_hedge():
+            logger.debug(u'Hedging request after {0:.3f}s: {1}'
+                         .format(delay, request.url))
+            start_attempt(1, request.copy())
+            pending = 2
+
+    errors = []
+    while True:
+        if item is None:
+            item = results.get()
+        pending -= 1
+        index, resp, err = item
+        item = None
+        if err is None or pending == 0:
+            break
+        errors.append(err)
+
+    with lock:
+        state['done'] = True
+    # Close any response that arrived while the winner was chosen
+    while True:
+        try:
+            _, other, _ = results.get_nowait()
+        except Empty:
+            break
+        if other is not None:
+            other.close()
+
+    if err is not None:
+        raise (errors or [err])[0]
+    if index == 1:
+        policy.hedge_won()
+    return resp
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from ...models import HostnamePortSslConfig
+from ...nginx import render_nginx_config, write_password_file
+from ...settings import get_pki_dir
+
+UPSTREAMS_FILE = 'pki_upstreams.conf'
+LOCATIONS_FILE = 'pki_locations.conf'
+
+
+class Command(BaseCommand):
+    help = ("Render nginx upstream and location blocks that fetch mapped "
+            "URLs over TLS per their SSL config, for /pki/ requests handed "
+            "off with X-Accel-Redirect (PKI_OFFLOAD = True). Include {0} in "
+            "nginx's http context, and {1} in the server block proxying to "
+            "Django. Decrypted client key passwords are written to files "
+            "readable only by the current user, which must be readable by "
+            "nginx's master process.".format(UPSTREAMS_FILE, LOCATIONS_FILE))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir',
+            default=None,
+            help='Directory to write {0} and {1} to (default: print both)'
+                 .format(UPSTREAMS_FILE, LOCATIONS_FILE))
+        parser.add_argument(
+            '--passwords-dir',
+            default=os.path.join(get_pki_dir(), 'nginx'),
+            help='Directory to write client key password files to '
+                 '(default: <PKI_DIRECTORY>/nginx)')
+        parser.add_argument(
+            '--resolver',
+            default=None,
+            help='nginx resolver address(es), for wildcard mappings')
+        parser.add_argument(
+            '--ca-bundle',
+            default='/etc/ssl/certs/ca-certificates.crt',
+            help='CA certs for SSL configs without custom CA certs')
+        parser.add_argument(
+            '--keepalive',
+            type=int,
+            default=16,
+            help='Idle connections kept per upstream (default: 16)')
+
+    def handle(self, *args, **options):
+        mappings = []
+        configs = HostnamePortSslConfig.objects.mapped_ssl_configs()
+        for ptn, config in configs.items():
+            config_dict = config.to_dict()
+            mappings.append((ptn, config.pk, config_dict))
+            if (config_dict.get('client_key_pass') and
+                    not config_dict.get('egress_proxy')):
+                path = write_password_file(options['passwords_dir'],
+                                           config.pk,
+                                           config_dict['client_key_pass'])
+                self.stderr.write(u'Wrote password file: {0}'.format(path))
+
+        upstreams, locations = render_nginx_config(
+            mappings,
+            options['passwords_dir'],
+            resolver=options['resolver'],
+            ca_bundle=options['ca_bundle'],
+            keepalive=options['keepalive'])
+
+        out_dir = options['output_dir']
+        if not out_dir:
+            self.stdout.write(u'# --- {0} (http context) ---\n{1}'
+                              .format(UPSTREAMS_FILE, upstreams))
+            self.stdout.write(u'# --- {0} (server block) ---\n{1}'
+                              .format(LOCATIONS_FILE, locations))
+            return
+        for name, text in [(UPSTREAMS_FILE, upstreams),
+                           (LOCATIONS_FILE, locations)]:
+            path = os.path.join(out_dir, name)
+            with open(path, 'w') as f:
+                f.write(text)
+            self.stderr.write(u'Wrote: {0}'.format(path))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from ...ssl_session import https_client, pool_stats
+
+
+class Command(BaseCommand):
+    help = ("Dump https_client adapter and connection pool stats as JSON. "
+            "Stats are per process; use --url to first connect to upstreams "
+            "from this process, or the staff-only /pki_stats/pools view for "
+            "a running server's worker.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            action='append',
+            dest='urls',
+            default=[],
+            help='URL to request (HEAD) before dumping stats; repeatable')
+        parser.add_argument(
+            '--indent',
+            type=int,
+            default=2,
+            help='JSON indentation (default: 2)')
+
+    def handle(self, *args, **options):
+        for url in options['urls']:
+            try:
+                resp = https_client.head(url)
+                self.stderr.write(u'{0} {1}'.format(resp.status_code, url))
+            except Exception as e:
+                self.stderr.write(u'ERROR {0}: {1}'.format(url, e))
+        self.stdout.write(
+            json.dumps(pool_stats(), indent=options['indent'] or None))
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ssl_pki', '0002_default_config'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslconfig',
+            name='tcp_nodelay',
+            field=models.BooleanField(
+                default=True,
+                help_text=b"Disable Nagle's algorithm (TCP_NODELAY) on "
+                          b"upstream sockets, so small writes are not "
+                          b"delayed. Recommended.",
+                verbose_name=b'TCP no delay'),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='tcp_keepalive',
+            field=models.BooleanField(
+                default=False,
+                help_text=b'(Optional) Enable TCP keepalive probes '
+                          b'(SO_KEEPALIVE) on upstream sockets, to detect '
+                          b'dead peers and keep idle connections open '
+                          b'through NAT/firewalls.',
+                verbose_name=b'TCP keepalive'),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='tcp_keepalive_idle',
+            field=models.PositiveIntegerField(
+                help_text=b'(Optional) Seconds a connection is idle before '
+                          b'keepalive probes are sent (TCP_KEEPIDLE). '
+                          b'Requires TCP keepalive. If undefined, the OS '
+                          b'default is used (often 2 hours).',
+                null=True,
+                verbose_name=b'TCP keepalive idle',
+                blank=True),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='tcp_keepalive_interval',
+            field=models.PositiveIntegerField(
+                help_text=b'(Optional) Seconds between keepalive probes '
+                          b'(TCP_KEEPINTVL). Requires TCP keepalive.',
+                null=True,
+                verbose_name=b'TCP keepalive interval',
+                blank=True),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='tcp_keepalive_count',
+            field=models.PositiveIntegerField(
+                help_text=b'(Optional) Unanswered keepalive probes before '
+                          b'the connection is dropped (TCP_KEEPCNT). '
+                          b'Requires TCP keepalive.',
+                null=True,
+                verbose_name=b'TCP keepalive count',
+                blank=True),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='socket_send_buffer',
+            field=models.PositiveIntegerField(
+                help_text=b'(Optional) Send buffer size in bytes '
+                          b'(SO_SNDBUF). Increase for large uploads over '
+                          b'high-latency links. If undefined, the OS default '
+                          b'(with auto-tuning) is used.',
+                null=True,
+                verbose_name=b'Socket send buffer',
+                blank=True),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='socket_recv_buffer',
+            field=models.PositiveIntegerField(
+                help_text=b"(Optional) Receive buffer size in bytes "
+                          b"(SO_RCVBUF). Increase for large downloads over "
+                          b"high-latency links, e.g. to the link's "
+                          b"bandwidth-delay product. If undefined, the OS "
+                          b"default (with auto-tuning) is used.",
+                null=True,
+                verbose_name=b'Socket receive buffer',
+                blank=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ssl_pki', '0003_socket_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslconfig',
+            name='timeout_connect',
+            field=models.FloatField(
+                help_text=b'(Optional) Maximum seconds to wait while '
+                          b'establishing an upstream connection (including '
+                          b'TLS handshake). Requests may ask for a shorter '
+                          b'timeout, never a longer one. If undefined, there '
+                          b'is no limit.',
+                null=True,
+                verbose_name=b'Connect timeout',
+                blank=True),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='timeout_read',
+            field=models.FloatField(
+                help_text=b'(Optional) Maximum seconds to wait between bytes '
+                          b'received from upstream. Requests may ask for a '
+                          b'shorter timeout, never a longer one. If '
+                          b'undefined, there is no limit.',
+                null=True,
+                verbose_name=b'Read timeout',
+                blank=True),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='timeout_total',
+            field=models.FloatField(
+                help_text=b'(Optional) Maximum seconds for an upstream '
+                          b'request, from connecting until its response body '
+                          b'is relayed, including any retries. Also caps the '
+                          b'connect and read timeouts. If undefined, there is '
+                          b'no limit.',
+                null=True,
+                verbose_name=b'Total deadline',
+                blank=True),
+        ),
+    ]
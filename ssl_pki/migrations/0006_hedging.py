@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ssl_pki', '0005_egress_proxy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslconfig',
+            name='hedge_requests',
+            field=models.BooleanField(
+                default=False,
+                help_text=b'(Optional) Send a second GET or HEAD request, on '
+                          b'another connection, if the first has not '
+                          b'returned response headers within the hedge '
+                          b'percentile of recent response times; the first '
+                          b'response wins. Reduces tail latency of slow or '
+                          b'flaky upstreams, at the cost of extra requests.',
+                verbose_name=b'Hedge requests'),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='hedge_percentile',
+            field=models.PositiveIntegerField(
+                default=95,
+                help_text=b'Percentile of recent response times (per '
+                          b'hostname:port) to wait before hedging a request.',
+                verbose_name=b'Hedge percentile'),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='hedge_budget',
+            field=models.PositiveIntegerField(
+                default=5,
+                help_text=b'Maximum percent of requests that may be hedged, '
+                          b'capping the extra load on upstreams.',
+                verbose_name=b'Hedge budget (%)'),
+        ),
+    ]
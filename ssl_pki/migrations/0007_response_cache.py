@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ssl_pki', '0006_hedging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hostnameportsslconfig',
+            name='cache_ttl',
+            field=models.PositiveIntegerField(
+                null=True,
+                blank=True,
+                help_text=b'(Optional) Seconds to cache GET and HEAD '
+                          b'responses of matched URLs in the /pki/ response '
+                          b'cache, overriding their Cache-Control and Expires '
+                          b'headers; 0 disables caching. Responses marked '
+                          b'no-store or private are never cached. If '
+                          b'undefined, upstream headers decide. Has no effect '
+                          b'unless PKI_RESPONSE_CACHE_MAX_SIZE is set.',
+                verbose_name=b'Cache TTL'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ssl_pki', '0007_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslconfig',
+            name='max_concurrent',
+            field=models.PositiveIntegerField(
+                null=True,
+                blank=True,
+                help_text=b'(Optional) Most /pki/ requests in flight at once '
+                          b'to each upstream hostname:port using this '
+                          b'config; further requests wait in its queue. '
+                          b'Keeps a slow upstream from holding every worker '
+                          b'thread. If undefined, there is no limit.',
+                verbose_name=b'Max concurrent requests'),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='queue_size',
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text=b'Most requests waiting for a free slot, per '
+                          b'upstream hostname:port, when max concurrent '
+                          b'requests are in flight; requests beyond it get a '
+                          b'503 response at once. Requires max concurrent '
+                          b'requests.',
+                verbose_name=b'Queue size'),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='queue_timeout',
+            field=models.FloatField(
+                null=True,
+                blank=True,
+                help_text=b'(Optional) Maximum seconds a request waits in '
+                          b'the queue before getting a 503 response. If '
+                          b'undefined, it waits until its deadline, if any.',
+                verbose_name=b'Queue timeout'),
+        ),
+    ]
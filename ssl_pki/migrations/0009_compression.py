@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ssl_pki', '0008_bulkhead'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslconfig',
+            name='compress_level',
+            field=models.PositiveIntegerField(
+                null=True,
+                blank=True,
+                help_text=b'(Optional) Level (1-9) at which uncompressed, '
+                          b'textual upstream responses (e.g. XML, JSON) are '
+                          b'compressed for clients accepting gzip or brotli; '
+                          b'0 disables compression. If undefined, the '
+                          b'PKI_COMPRESS_LEVEL setting is used.',
+                verbose_name=b'Compression level'),
+        ),
+        migrations.AddField(
+            model_name='sslconfig',
+            name='compress_min_size',
+            field=models.PositiveIntegerField(
+                null=True,
+                blank=True,
+                help_text=b'(Optional) Smallest response body, in bytes, '
+                          b'that is compressed. If undefined, the '
+                          b'PKI_COMPRESS_MIN_SIZE setting is used.',
+                verbose_name=b'Compression minimum size'),
+        ),
+    ]
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import os
+import ssl
+import hashlib
+import logging
+
+from urllib import quote
+
+from .models import mapping_options_for_url
+from .settings import OFFLOAD_PREFIX
+from .utils import (
+    CONDITIONAL_HEADERS, RANGE_HEADERS, parse_url, pki_file)
+
+
+logger = logging.getLogger(__name__)
+
+# nginx protocol names, per ssl module option disabling each
+_nginx_protocols = [
+    ('SSLv3', 'OP_NO_SSLv3'),
+    ('TLSv1', 'OP_NO_TLSv1'),
+    ('TLSv1.1', 'OP_NO_TLSv1_1'),
+    ('TLSv1.2', 'OP_NO_TLSv1_2'),
+    ('TLSv1.3', 'OP_NO_TLSv1_3'),
+]
+
+# ssl module protocols pinned to one version
+_nginx_pinned_protocols = {
+    'PROTOCOL_SSLv3': 'SSLv3',
+    'PROTOCOL_TLSv1': 'TLSv1',
+    'PROTOCOL_TLSv1_1': 'TLSv1.1',
+    'PROTOCOL_TLSv1_2': 'TLSv1.2',
+}
+
+# Client request headers nginx sends upstream; all others (e.g. cookies and
+# authorization) are dropped, as by the /pki/ view
+_nginx_pass_headers = [
+    (header, '$http_' + header.lower().replace('-', '_'))
+    for header in ['Accept', 'Accept-Encoding', 'Accept-Language'] +
+    [h for h, _ in CONDITIONAL_HEADERS + RANGE_HEADERS]
+]
+
+
+def offload_key(ptn):
+    """
+    Stable, nginx-safe name for a hostname:port mapping pattern
+    :rtype: str
+    """
+    return 'pki_' + hashlib.sha1(ptn.encode('utf-8')).hexdigest()[:12]
+
+
+def offload_route(url):
+    """
+    Internal nginx URI that fetches a URL, for an X-Accel-Redirect header
+    :param url: Upstream https URL, or ParsedUrl
+    :return: URI, or None if URL is not mapped or can not be offloaded
+    :rtype: str | None
+    """
+    url = parse_url(url)
+    ptn, options = mapping_options_for_url(url)
+    if ptn is None or options is None or options.egress_proxy:
+        # nginx can not tunnel through an egress proxy
+        return None
+    path = url.url[len(url.base_url):] or '/'
+    if not path.startswith('/'):
+        path = '/' + path
+    # Header must be ASCII; keep any existing escapes and query delimiters
+    path = quote(path, safe="/%?&=;:@,+!$'()*~")
+    return '{0}{1}/{2}{3}'.format(
+        OFFLOAD_PREFIX, offload_key(ptn), url.hostname_port, path)
+
+
+def nginx_ssl_protocols(config):
+    """
+    :param config: SslConfig.to_dict()
+    :rtype: str | None
+    """
+    version = config.get('ssl_version')
+    if version in _nginx_pinned_protocols:
+        return _nginx_pinned_protocols[version]
+    disabled = config.get('ssl_options') or []
+    # Only protocols the ssl module (and so the /pki/ view) can negotiate
+    protocols = [p for p, op in _nginx_protocols
+                 if hasattr(ssl, op) and op not in disabled]
+    return ' '.join(protocols) or None
+
+
+def password_file(directory, ssl_config_id):
+    return os.path.join(directory, 'ssl_config_{0}.pass'.format(ssl_config_id))
+
+
+def write_password_file(directory, ssl_config_id, password):
+    """
+    Write a decrypted client key password, readable only by its owner
+    :return: Path of file
+    :rtype: str
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    path = password_file(directory, ssl_config_id)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.fchmod(fd, 0o600)  # if file already existed
+        os.write(fd, password.encode('utf-8') + b'\n')
+    finally:
+        os.close(fd)
+    return path
+
+
+def _seconds(value):
+    return '{0}s'.format(int(max(1, round(value))))
+
+
+def ssl_directives(ssl_config_id, config, passwords_dir,
+                   ca_bundle='/etc/ssl/certs/ca-certificates.crt'):
+    """
+    nginx proxy_ssl_* (and timeout) directives for an SslConfig
+    :param config: SslConfig.to_dict()
+    :rtype: list[str]
+    """
+    lines = []
+    if config.get('client_cert'):
+        lines.append('proxy_ssl_certificate {0};'
+                     .format(pki_file(config['client_cert'])))
+        lines.append('proxy_ssl_certificate_key {0};'
+                     .format(pki_file(config['client_key'])))
+        if config.get('client_key_pass'):
+            lines.append('proxy_ssl_password_file {0};'.format(
+                password_file(passwords_dir, ssl_config_id)))
+    verify = config.get('ssl_verify_mode') != 'CERT_NONE'
+    lines.append('proxy_ssl_verify {0};'.format('on' if verify else 'off'))
+    if verify:
+        lines.append('proxy_ssl_verify_depth 9;')
+        lines.append('proxy_ssl_trusted_certificate {0};'.format(
+            pki_file(config['ca_custom_certs'])
+            if config.get('ca_custom_certs') else ca_bundle))
+    protocols = nginx_ssl_protocols(config)
+    if protocols:
+        lines.append('proxy_ssl_protocols {0};'.format(protocols))
+    if config.get('ssl_ciphers'):
+        lines.append('proxy_ssl_ciphers {0};'.format(config['ssl_ciphers']))
+    lines.append('proxy_ssl_server_name on;')
+    lines.append('proxy_ssl_session_reuse on;')
+    if config.get('timeout_connect'):
+        lines.append('proxy_connect_timeout {0};'
+                     .format(_seconds(config['timeout_connect'])))
+    if config.get('timeout_read'):
+        lines.append('proxy_read_timeout {0};'
+                     .format(_seconds(config['timeout_read'])))
+    return lines
+
+
+def render_nginx_config(mappings, passwords_dir, resolver=None,
+                        ca_bundle='/etc/ssl/certs/ca-certificates.crt',
+                        keepalive=16):
+    """
+    Render nginx upstream and location blocks for offloaded /pki/ requests
+    :param mappings: Ordered (pattern, SslConfig id, SslConfig.to_dict())
+    :param passwords_dir: Directory of client key password files
+    :param resolver: nginx resolver address(es), needed by wildcard patterns
+    :param keepalive: Idle upstream connections kept per exact mapping
+    :return: Upstream blocks (for the http context) and location blocks (for
+        the server block proxying to Django)
+    :rtype: (str, str)
+    """
+    upstreams = []
+    locations = []
+    for ptn, ssl_config_id, config in mappings:
+        key = offload_key(ptn)
+        header = '# {0} -> SSL config: {1}'.format(ptn, config.get('name'))
+        if config.get('egress_proxy'):
+            locations.append('{0}\n# Skipped: egress proxy is not supported '
+                             'by nginx; proxied by Django\n'.format(header))
+            continue
+        directives = ssl_directives(ssl_config_id, config, passwords_dir,
+                                    ca_bundle=ca_bundle)
+        block = [header]
+        if '*' in ptn:
+            block.append('location ~ ^{0}{1}/(?<pki_host>[^/]+)'
+                         '(?<pki_path>/.*)$ {{'.format(OFFLOAD_PREFIX, key))
+            block.append('    internal;')
+            if resolver:
+                block.append('    resolver {0};'.format(resolver))
+            else:
+                block.append('    # resolver <address>;  (required, as '
+                             'upstream host is only known per request)')
+            block.append('    proxy_pass https://$pki_host$pki_path'
+                         '$is_args$args;')
+            block.append('    proxy_set_header Host $pki_host;')
+        else:
+            url = parse_url('https://' + ptn)
+            upstreams.append('\n'.join([
+                header,
+                'upstream {0} {{'.format(key),
+                '    server {0}:{1};'.format(url.hostname, url.port or 443),
+                '    keepalive {0};'.format(keepalive),
+                '}',
+                '']))
+            block.append('location {0}{1}/ {{'.format(OFFLOAD_PREFIX, key))
+            block.append('    internal;')
+            block.append('    rewrite ^{0}{1}/[^/]+(/.*)$ $1 break;'
+                         .format(OFFLOAD_PREFIX, key))
+            block.append('    proxy_pass https://{0};'.format(key))
+            block.append('    proxy_set_header Host {0};'.format(ptn))
+            block.append('    proxy_ssl_name {0};'.format(url.hostname))
+            block.append('    proxy_http_version 1.1;')
+            block.append('    proxy_set_header Connection "";')
+        block.append('    proxy_pass_request_headers off;')
+        for name, var in _nginx_pass_headers:
+            block.append('    proxy_set_header {0} {1};'.format(name, var))
+        block.extend(['    ' + line for line in directives])
+        block.append('}')
+        block.append('')
+        locations.append('\n'.join(block))
+    return '\n'.join(upstreams), '\n'.join(locations)
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+import weakref
+import logging
+import threading
+
+from collections import OrderedDict
+
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .settings import POOL_IDLE_TIMEOUT, POOL_REAP_INTERVAL, POOL_MAX_SOCKETS
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionRegistry(object):
+    """
+    Process-wide bookkeeping of upstream connections held by PKI pools.
+
+    Idle connections are kept in least-recently-used order, so the reaper and
+    the global socket cap can close them across all pools (and therefore all
+    SslContextAdapters) in the process.
+
+    :param idle_timeout: Seconds before an idle connection is closed; 0 to
+        disable idle closing
+    :param max_sockets: Cap on open upstream sockets; 0 for no cap
+    """
+    def __init__(self, idle_timeout=POOL_IDLE_TIMEOUT,
+                 max_sockets=POOL_MAX_SOCKETS):
+        self.idle_timeout = idle_timeout
+        self.max_sockets = max_sockets
+        self.reset()
+
+    def reset(self):
+        """Forget all tracked connections (does not close them)"""
+        self._lock = threading.RLock()
+        # id(conn) -> (conn, idle since timestamp), oldest first
+        self._idle = OrderedDict()
+        # Connections whose responses are abandoned without being released
+        # are garbage collected, so they drop out of the in-use count
+        self._in_use = weakref.WeakValueDictionary()
+        self.reaped = 0
+        self.evicted = 0
+
+    def idle_count(self):
+        return len(self._idle)
+
+    def in_use_count(self):
+        return len(self._in_use)
+
+    def open_count(self):
+        return self.idle_count() + self.in_use_count()
+
+    def checkout(self, conn):
+        """
+        Record a connection taken from its pool.
+        :return: Seconds the connection sat idle, or None if it was not idle
+        :rtype: float | None
+        """
+        with self._lock:
+            entry = self._idle.pop(id(conn), None)
+            self._in_use[id(conn)] = conn
+        if entry is None:
+            return None
+        return time.time() - entry[1]
+
+    def checkin(self, conn):
+        """Record a connection returned to its pool"""
+        if conn is None:
+            return
+        with self._lock:
+            self._in_use.pop(id(conn), None)
+            if getattr(conn, 'sock', None) is not None:
+                self._idle[id(conn)] = (conn, time.time())
+        self.enforce_cap()
+
+    def discard(self, conn):
+        """Stop tracking a connection, e.g. when its pool is closed"""
+        if conn is None:
+            return
+        with self._lock:
+            self._idle.pop(id(conn), None)
+            self._in_use.pop(id(conn), None)
+
+    def enforce_cap(self):
+        """
+        Close least-recently-used idle connections, until the number of open
+        sockets is within max_sockets. In-use connections are never closed.
+        :return: Number of connections closed
+        :rtype: int
+        """
+        if not self.max_sockets:
+            return 0
+        closed = 0
+        with self._lock:
+            while self._idle and self.open_count() > self.max_sockets:
+                _, (conn, _) = self._idle.popitem(last=False)
+                # Closing under the lock ensures a concurrent checkout sees
+                # either an untouched or a fully closed (reconnectable) conn
+                conn.close()
+                closed += 1
+            self.evicted += closed
+        if closed:
+            logger.debug(u'Closed {0} LRU idle connection(s), over cap of {1}'
+                         .format(closed, self.max_sockets))
+        return closed
+
+    def reap(self, now=None):
+        """
+        Close connections that have been idle longer than idle_timeout.
+        :return: Number of connections closed
+        :rtype: int
+        """
+        if not self.idle_timeout:
+            return 0
+        now = now or time.time()
+        closed = 0
+        with self._lock:
+            for key, (conn, since) in list(self._idle.items()):
+                if now - since < self.idle_timeout:
+                    break  # ordered oldest first
+                del self._idle[key]
+                conn.close()
+                closed += 1
+            self.reaped += closed
+        if closed:
+            logger.debug(u'Reaped {0} idle connection(s)'.format(closed))
+        return closed
+
+
+# global, so the cap and reaping apply across every adapter's pools
+connection_registry = ConnectionRegistry()
+
+
+class PkiConnectionPoolMixin(object):
+    """
+    Reports connection checkouts/checkins to the process connection registry.
+
+    Connections idle longer than the registry's idle_timeout are not trusted
+    to still be alive upstream (most servers' keep-alive timeouts are shorter)
+    and are closed upon checkout, so they reconnect instead of failing a write
+    and then retrying. urllib3 has already polled for dropped sockets by then.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PkiConnectionPoolMixin, self).__init__(*args, **kwargs)
+        # For introspection; approximate under concurrency
+        self.num_in_use = 0
+        self.num_discarded = 0
+
+    def _get_conn(self, timeout=None):
+        conn = super(PkiConnectionPoolMixin, self)._get_conn(timeout=timeout)
+        self.num_in_use += 1
+        # Pick up any SSL context swapped in since conn was created; only
+        # used if conn (re)connects, so established sessions drain untouched
+        if hasattr(conn, 'ssl_context') and 'ssl_context' in self.conn_kw:
+            conn.ssl_context = self.conn_kw['ssl_context']
+        registry = connection_registry
+        idle = registry.checkout(conn)
+        if (idle is not None and registry.idle_timeout and
+                idle >= registry.idle_timeout and
+                getattr(conn, 'sock', None) is not None):
+            logger.debug(u'Closing connection idle for {0:.1f}s before reuse: '
+                         u'{1}:{2}'.format(idle, self.host, self.port))
+            conn.close()
+        return conn
+
+    def _put_conn(self, conn):
+        had_sock = getattr(conn, 'sock', None) is not None
+        super(PkiConnectionPoolMixin, self)._put_conn(conn)
+        self.num_in_use = max(0, self.num_in_use - 1)
+        if had_sock and conn.sock is None:
+            # Pool was full (or closed), so conn was closed and discarded
+            self.num_discarded += 1
+        # A conn discarded by a full pool is already closed, so not tracked
+        connection_registry.checkin(conn)
+
+    def close(self):
+        pool = self.pool
+        if pool is not None:
+            for conn in list(pool.queue):
+                connection_registry.discard(conn)
+        super(PkiConnectionPoolMixin, self).close()
+
+
+class PkiHTTPConnectionPool(PkiConnectionPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class PkiHTTPSConnectionPool(PkiConnectionPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+pki_pool_classes_by_scheme = {
+    'http': PkiHTTPConnectionPool,
+    'https': PkiHTTPSConnectionPool,
+}
+
+
+def connection_pool_stats(pool):
+    """
+    :type pool: urllib3.HTTPConnectionPool
+    :rtype: dict
+    """
+    queue = pool.pool
+    conns = [c for c in list(queue.queue) if c is not None] \
+        if queue is not None else []
+    return {
+        'scheme': pool.scheme,
+        'host': pool.host,
+        'port': pool.port,
+        'maxsize': queue.maxsize if queue is not None else 0,
+        'idle_open': len([c for c in conns
+                          if getattr(c, 'sock', None) is not None]),
+        'idle_closed': len([c for c in conns
+                            if getattr(c, 'sock', None) is None]),
+        'in_use': getattr(pool, 'num_in_use', None),
+        'connections_created': pool.num_connections,
+        'requests': pool.num_requests,
+        'discarded': getattr(pool, 'num_discarded', None),
+    }
+
+
+def pool_manager_stats(manager):
+    """
+    :type manager: urllib3.PoolManager
+    :rtype: list[dict]
+    """
+    stats = []
+    for key in manager.pools.keys():
+        pool = manager.pools.get(key)
+        if pool is not None:
+            stats.append(connection_pool_stats(pool))
+    return stats
+
+
+def registry_stats(registry=None):
+    """
+    :type registry: ConnectionRegistry
+    :rtype: dict
+    """
+    registry = registry or connection_registry
+    return {
+        'open': registry.open_count(),
+        'idle': registry.idle_count(),
+        'in_use': registry.in_use_count(),
+        'reaped': registry.reaped,
+        'evicted': registry.evicted,
+        'idle_timeout': registry.idle_timeout,
+        'max_sockets': registry.max_sockets,
+    }
+
+
+def use_pki_pools(manager):
+    """
+    Have a urllib3 PoolManager (or ProxyManager) create registry-aware pools
+    :type manager: urllib3.PoolManager
+    :rtype: urllib3.PoolManager
+    """
+    manager.pool_classes_by_scheme = pki_pool_classes_by_scheme
+    ensure_reaper()
+    return manager
+
+
+class IdleConnectionReaper(threading.Thread):
+    """Background thread that periodically reaps idle connections"""
+
+    def __init__(self, registry, interval):
+        super(IdleConnectionReaper, self).__init__(
+            name='ssl_pki-idle-connection-reaper')
+        self.daemon = True
+        self.registry = registry
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.registry.reap()
+            except Exception as e:
+                logger.warn(u'Idle connection reaper error: {0}'.format(e))
+
+    def stop(self):
+        self._stopped.set()
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def ensure_reaper():
+    """
+    Lazily start the reaper thread, once per process.
+    Threads do not survive a fork, so a forked worker starts its own here.
+    """
+    global _reaper
+    if not POOL_REAP_INTERVAL or not connection_registry.idle_timeout:
+        return None
+    if _reaper is not None and _reaper.is_alive():
+        return _reaper
+    with _reaper_lock:
+        if _reaper is None or not _reaper.is_alive():
+            _reaper = IdleConnectionReaper(connection_registry,
+                                           POOL_REAP_INTERVAL)
+            _reaper.start()
+            logger.debug(u'Idle connection reaper started, interval: {0}s'
+                         .format(POOL_REAP_INTERVAL))
+    return _reaper
+
+
+def reset_after_fork():
+    """
+    Forget connections and reaper thread inherited from a parent process,
+    including any locks that were held by parent threads at fork time.
+    """
+    global _reaper, _reaper_lock
+    connection_registry.reset()
+    _reaper = None
+    _reaper_lock = threading.Lock()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import json
+import time
+import random
+import logging
+
+from collections import OrderedDict
+
+try:
+    from logtailer.utils import logging_timer_expired
+except ImportError:
+    logging_timer_expired = None
+
+from .settings import LOG_SAMPLE_RATE, LOG_BODY_MAX_SIZE, LOG_REDACT_HEADERS
+from .streaming import decoded_body
+
+
+logger = logging.getLogger(__name__)
+
+REDACTED = u'[redacted]'
+
+
+def _header_name(name):
+    """Header name, also from a request.META key, e.g. HTTP_COOKIE"""
+    name = name.lower()
+    if name.startswith('http_'):
+        name = name[5:]
+    return name.replace('_', '-')
+
+
+def redacted_headers(headers, redact=None):
+    """
+    :param headers: Dict of headers, or of request.META, or (header, value)
+        pairs
+    :param redact: Lowercase header names whose values are hidden
+    :return: (header, value) pairs, sorted
+    :rtype: list[tuple]
+    """
+    if redact is None:
+        redact = LOG_REDACT_HEADERS
+    if hasattr(headers, 'items'):
+        headers = headers.items()
+    return sorted([(h, REDACTED if _header_name(h) in redact else v)
+                   for h, v in headers])
+
+
+def format_headers(headers, redact=None):
+    """:rtype: unicode"""
+    return u'\n'.join([u'  {0}: {1}'.format(h, v)
+                       for h, v in redacted_headers(headers, redact)])
+
+
+def truncated(text, max_size=None):
+    """
+    :param max_size: Length to truncate to; 0 for no limit
+    :rtype: unicode
+    """
+    if max_size is None:
+        max_size = LOG_BODY_MAX_SIZE
+    size = len(text)
+    if isinstance(text, bytes):
+        text = text[:max_size or size].decode('utf-8', 'replace')
+    if not max_size or size <= max_size:
+        return text
+    return u'{0}... ({1} of {2} bytes)'.format(text[:max_size], max_size, size)
+
+
+def _logfmt_value(value):
+    if value is None:
+        return u'-'
+    if isinstance(value, float):
+        return u'{0:.3f}'.format(value)
+    value = value if isinstance(value, basestring) else unicode(value)  # noqa
+    if not value or any([c in value for c in u' "=']):
+        return json.dumps(value)
+    return value
+
+
+def logfmt(fields):
+    """
+    :param fields: Ordered (name, value) pairs
+    :return: Compact 'name=value name2="a value"' text
+    :rtype: unicode
+    """
+    return u' '.join([u'{0}={1}'.format(k, _logfmt_value(v))
+                      for k, v in fields.items()])
+
+
+class RequestLog(object):
+    """
+    Logging for one proxied /pki/ request: details (headers, bodies) at DEBUG
+    level, and one compact record at INFO level, when it is done.
+
+    Only a sampled fraction of requests are logged, and nothing is formatted
+    unless its record will be emitted.
+
+    :param method: HTTP method of the request
+    :param log: Logger to emit records to
+    :param sample_rate: Fraction of requests to log, from 0 to 1
+    """
+    def __init__(self, method, log=None, sample_rate=None):
+        self.logger = log or logger
+        if sample_rate is None:
+            sample_rate = LOG_SAMPLE_RATE
+        self.sampled = sample_rate >= 1 or random.random() < sample_rate
+        self.verbose = self.sampled and \
+            self.logger.isEnabledFor(logging.DEBUG)
+        self.start = time.time()
+        self.fields = OrderedDict([('method', method)])
+
+    def set(self, **fields):
+        """Add fields to the compact record"""
+        self.fields.update(fields)
+
+    def detail(self, label, value):
+        """
+        :param value: Detail text, or a callable returning it, which is only
+            called if the detail is logged
+        """
+        if not self.verbose:
+            return
+        if callable(value):
+            value = value()
+        self.logger.debug(u'PKI view {0}:\n{1}'.format(label, value))
+
+    def headers(self, label, headers):
+        if self.verbose:
+            self.detail(label, format_headers(headers))
+
+    def body(self, content, content_type, encoding=None):
+        """
+        Log a textual body, decompressed and truncated
+        :param encoding: Content-Encoding of content, if still encoded
+        """
+        if not self.verbose or not any(
+                [t in content_type.lower() for t in ['text', 'json', 'xml']]):
+            return
+        text = decoded_body(content, encoding)
+        if text is None:
+            text = 'Not decodable content'
+        elif ('json' in content_type.lower() and
+                callable(logging_timer_expired) and
+                not logging_timer_expired()):
+            # Format JSON as needed for client log output
+            try:
+                text = json.dumps(json.loads(text), indent=2)
+            except ValueError:
+                pass
+        self.detail('response content', truncated(text))
+
+    def emit(self, response, bytes_sent=None):
+        """
+        Log the compact record of the request, given its response
+        :type response: django.http.HttpResponseBase
+        :param bytes_sent: Bytes of a streamed response, once relayed, if
+            known (otherwise its Content-Length, if any)
+        """
+        if not self.sampled or not self.logger.isEnabledFor(logging.INFO):
+            return
+        fields = OrderedDict(self.fields)
+        fields['status'] = response.status_code
+        fields['elapsed'] = time.time() - self.start
+        fields['cache'] = response.get('X-Pki-Cache', None)
+        if response.streaming:
+            fields['streamed'] = True
+            fields['bytes'] = bytes_sent if bytes_sent is not None \
+                else response.get('Content-Length', None)
+        else:
+            fields['bytes'] = len(response.content)
+        self.logger.info(u'PKI view request {0}'.format(logfmt(fields)),
+                         extra={'pki': fields})
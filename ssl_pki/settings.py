@@ -40,6 +40,110 @@ def get_pki_dir():
     return '/usr/local/django-ssl-pki'
 
 
+# Seconds a pooled upstream connection may sit idle before it is closed,
+# either by the background reaper or upon its next checkout from a pool.
+# 0 disables idle closing.
+POOL_IDLE_TIMEOUT = float(getattr(settings, 'PKI_POOL_IDLE_TIMEOUT', 60))
+
+# Seconds between background reaper sweeps of idle connections.
+# 0 disables the reaper thread (idle connections are then only closed lazily).
+POOL_REAP_INTERVAL = float(getattr(settings, 'PKI_POOL_REAP_INTERVAL', 15))
+
+# Per-process cap on open upstream sockets, across all SslContextAdapters.
+# Least-recently-used idle connections are closed to stay under the cap.
+# 0 means no cap.
+POOL_MAX_SOCKETS = int(getattr(settings, 'PKI_POOL_MAX_SOCKETS', 512))
+
+# Seconds between checks of PKI files (CA certs, client certs and keys) for
+# changes on disk. SSL contexts using changed files are rebuilt and used for
+# new connections. 0 disables checking.
+FILE_CHECK_INTERVAL = float(getattr(settings, 'PKI_FILE_CHECK_INTERVAL', 30))
+
+# Default bound on worker threads for SslContextSession.gather() fan-outs, and
+# on concurrent requests to any one hostname:port within a fan-out
+FANOUT_MAX_WORKERS = int(getattr(settings, 'PKI_FANOUT_MAX_WORKERS', 8))
+FANOUT_PER_HOST = int(getattr(settings, 'PKI_FANOUT_PER_HOST', 4))
+
+# Most resources fetched by one /pki_batch/ request, and the largest response
+# body, in bytes, returned for any of them
+BATCH_MAX_ITEMS = int(getattr(settings, 'PKI_BATCH_MAX_ITEMS', 500))
+BATCH_ITEM_MAX_SIZE = int(
+    getattr(settings, 'PKI_BATCH_ITEM_MAX_SIZE', 10 * 1024 * 1024))
+
+# Bytes per chunk when relaying upstream response bodies through /pki/
+STREAM_CHUNK_SIZE = int(getattr(settings, 'PKI_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Largest textual upstream response body (by Content-Length) that /pki/ reads
+# fully, for inspection and logging, before relaying; others are streamed
+BUFFER_MAX_SIZE = int(getattr(settings, 'PKI_BUFFER_MAX_SIZE', 1024 * 1024))
+
+# Bytes of a fully read upstream response body held in memory; larger bodies
+# (e.g. once decompressed) spill to a temporary file in SPOOL_DIR (default:
+# the system's), and are relayed from it
+SPOOL_MAX_MEMORY = int(getattr(settings, 'PKI_SPOOL_MAX_MEMORY', 1024 * 1024))
+SPOOL_DIR = getattr(settings, 'PKI_SPOOL_DIR', None)
+
+# Whether /pki/ relays compressed (e.g. gzip) upstream response bodies as is,
+# with their Content-Encoding, instead of decompressing them for the client
+PASSTHROUGH_ENCODING = bool(
+    getattr(settings, 'PKI_PASSTHROUGH_ENCODING', True))
+
+# Whether /pki/ forwards POST/PUT/PATCH bodies upstream as they are read from
+# the client, instead of first loading them into memory
+STREAM_REQUEST_BODY = bool(getattr(settings, 'PKI_STREAM_REQUEST_BODY', False))
+
+# Largest request body /pki/ forwards upstream, in bytes; 0 means no limit
+REQUEST_BODY_MAX_SIZE = int(getattr(settings, 'PKI_REQUEST_BODY_MAX_SIZE', 0))
+
+# Recent response times (to headers) kept per upstream for hedged requests,
+# and how many are needed before hedging starts
+HEDGE_WINDOW = int(getattr(settings, 'PKI_HEDGE_WINDOW', 200))
+HEDGE_MIN_SAMPLES = int(getattr(settings, 'PKI_HEDGE_MIN_SAMPLES', 20))
+
+# Bound on memory used by the /pki/ response cache of GET and HEAD responses,
+# in bytes; 0 disables the cache. Entries over the max entry size are skipped.
+RESPONSE_CACHE_MAX_SIZE = int(
+    getattr(settings, 'PKI_RESPONSE_CACHE_MAX_SIZE', 0))
+RESPONSE_CACHE_MAX_ENTRY_SIZE = int(
+    getattr(settings, 'PKI_RESPONSE_CACHE_MAX_ENTRY_SIZE', 1024 * 1024))
+
+# Seconds to cache responses without explicit freshness (Cache-Control
+# max-age or Expires); 0 caches only those with it
+RESPONSE_CACHE_DEFAULT_TTL = int(
+    getattr(settings, 'PKI_RESPONSE_CACHE_DEFAULT_TTL', 0))
+
+# Fraction (0 to 1) of /pki/ requests that are logged, as one compact INFO
+# record each, plus DEBUG details of their headers and (truncated) bodies
+LOG_SAMPLE_RATE = float(getattr(settings, 'PKI_LOG_SAMPLE_RATE', 1.0))
+
+# Characters of a textual body logged at DEBUG level; 0 means no limit
+LOG_BODY_MAX_SIZE = int(getattr(settings, 'PKI_LOG_BODY_MAX_SIZE', 2048))
+
+# Headers whose values are never logged (lowercase)
+LOG_REDACT_HEADERS = [h.lower() for h in getattr(
+    settings, 'PKI_LOG_REDACT_HEADERS',
+    ['authorization', 'proxy-authorization', 'cookie', 'set-cookie',
+     'x-csrftoken'])]
+
+# Seconds that /pki/ GET requests wait for an identical, cacheable request
+# already in flight upstream, to share its response; 0 disables coalescing.
+COALESCE_TIMEOUT = float(getattr(settings, 'PKI_COALESCE_TIMEOUT', 0))
+
+# Level (1-9) at which /pki/ compresses uncompressed, textual responses, for
+# clients accepting gzip (or brotli, if installed); 0 disables compression.
+# SSL configs may set their own level and minimum size, in bytes.
+COMPRESS_LEVEL = int(getattr(settings, 'PKI_COMPRESS_LEVEL', 0))
+COMPRESS_MIN_SIZE = int(getattr(settings, 'PKI_COMPRESS_MIN_SIZE', 1024))
+
+# Whether /pki/ GET and HEAD requests of mapped URLs are handed to nginx via
+# X-Accel-Redirect, once authenticated, instead of being proxied by Django.
+# Requires nginx config rendered by the pki_nginx_config command.
+OFFLOAD = bool(getattr(settings, 'PKI_OFFLOAD', False))
+
+# Internal nginx location prefix of offloaded requests
+OFFLOAD_PREFIX = str(getattr(settings, 'PKI_OFFLOAD_PREFIX', '/_pki_offload/'))
+
+
 # TODO: Add .p12|.pfx regex support for cert_match
 CERT_MATCH = ".*\.(crt|CRT|pem|PEM)$"
 KEY_MATCH = ".*\.(key|KEY|pem|PEM)$"
@@ -25,11 +25,17 @@ from fnmatch import fnmatch
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver, Signal
 
+from .cache import response_cache
 from .models import (
     rebuild_hostnameport_pattern_cache,
-    HostnamePortSslConfig
+    HostnamePortSslConfig,
+    SslConfig,
+)
+from .ssl_adapter import (
+    SslContextAdapter,
+    compile_ssl_config,
+    prune_ssl_context_cache,
 )
-from .ssl_adapter import SslContextAdapter
 from .ssl_session import https_client
 from .utils import (
     hostname_port,
@@ -70,8 +76,7 @@ def sync_https_adapters():
                          u'{0} > {1}'.format(base_url, ptn))
             config = ssl_configs[ptn]
             if (not isinstance(adpter, SslContextAdapter) or
-                    (adpter.context_options() !=
-                     SslContextAdapter.ssl_config_to_context_opts(config))):
+                    (adpter.compiled_config() != compile_ssl_config(config))):
                 # SslConfig differs, or needs to be SslContextAdapter; replace
                 adpter.close()  # clean up session pool manager
                 # The mount() call wraps a dictionary[key] = value assignment,
@@ -100,6 +105,13 @@ def sync_https_adapters():
                          .format(base_url))
             continue
 
+    # Drop any cached SSL contexts of SslConfigs that are no longer mapped
+    keep_keys = set(compile_ssl_config(config).context_key
+                    for config in ssl_configs.values())
+    pruned = prune_ssl_context_cache(keep_keys)
+    if pruned:
+        logger.debug(u'Pruned {0} unmapped SSL context(s)'.format(pruned))
+
 
 # noinspection PyUnusedLocal
 @receiver(post_save, sender=HostnamePortSslConfig,
@@ -124,3 +136,26 @@ def remove_mapping(sender, instance, using, **kwargs):
     rebuild_hostnameport_pattern_cache()
     sync_https_adapters()
     patterns_changed.send(HostnamePortSslConfig)
+
+
+# noinspection PyUnusedLocal
+@receiver(patterns_changed, dispatch_uid='ssl_pki_signals_patterns_changed')
+def invalidate_response_cache(sender, **kwargs):
+    """
+    Respond to mapping changes, which may change which SslConfig, or cache
+    TTL, applies to cached responses
+    """
+    response_cache.invalidate()
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=SslConfig,
+          dispatch_uid='ssl_pki_signals_ssl_config_post_save')
+@receiver(post_delete, sender=SslConfig,
+          dispatch_uid='ssl_pki_signals_ssl_config_post_delete')
+def ssl_config_changed(sender, instance, using, **kwargs):
+    """
+    Respond to SslConfig updates/deletions
+    """
+    rebuild_hostnameport_pattern_cache()  # mapping options include config's
+    response_cache.invalidate(ssl_config_id=instance.pk)
@@ -18,32 +18,274 @@
 #
 #########################################################################
 
-import re
+import os
 # We need import ssl to fail if it can't be imported.
 # urllib3.create_urllib3_context() will create a context without support for
 # PKI private key password otherwise.
-import ssl
+import ssl  # noqa
+import time
+import socket
 import logging
+import threading
 
 from ssl import Purpose, SSLError
 from requests.adapters import HTTPAdapter
+from requests.exceptions import ReadTimeout
 from urllib3.util.ssl_ import (create_urllib3_context,
                                resolve_ssl_version,
                                resolve_cert_reqs)
 from urllib3.util.retry import Retry
-# noinspection PyCompatibility
-from urlparse import urlparse
 
 from .models import SslConfig, ssl_config_for_url
+from .utils import ParsedUrl, normalize_hostname
+from .bulkhead import Bulkhead
+from .hedging import HedgePolicy, send_hedged
+from .pools import use_pki_pools
+from .ssl_constants import ssl_constants
 
 
 logger = logging.getLogger(__name__)
 
+# Global cache of built SSL contexts, keyed by context options, so adapters
+# (and their proxy managers) for the same SslConfig share one parsed CA store
+# and client cert chain. Building before a pre-forking server forks its
+# workers lets them share the parsed stores copy-on-write.
+ssl_context_cache = dict()
+_ssl_context_cache_lock = threading.Lock()
+
+# Stamps of the PKI files each cached SSL context was built from
+ssl_context_file_stamps = dict()
+
+# Global cache of compiled SslConfig options, keyed by frozen config values
+compiled_ssl_config_cache = dict()
+COMPILED_SSL_CONFIG_CACHE_MAX = 256
+
+# Global cache of proxy managers, keyed by proxy URL and adapter options, so
+# adapters for the same SslConfig share one pool of tunnelled connections;
+# values are [manager, number of adapters using it]
+proxy_manager_cache = dict()
+_proxy_manager_cache_lock = threading.Lock()
+
 
 class SslContextAdapterError(Exception):
     pass
 
 
+class DeadlineExceeded(ReadTimeout):
+    """An upstream request exceeded its total deadline"""
+    pass
+
+
+def min_timeout(*timeouts):
+    """
+    Smallest of any defined timeouts
+    :rtype: float | None
+    """
+    defined = [t for t in timeouts if t is not None]
+    return min(defined) if defined else None
+
+
+def _freeze(value):
+    """Hashable version of a config or options value"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class CompiledSslConfig(object):
+    """
+    Immutable, hashable SslContextAdapter options compiled from an SslConfig,
+    so adapters, adapter syncing and the SSL context cache can compare and
+    key on them without recompiling.
+    """
+    __slots__ = ('ctx_create_opts', 'ctx_opts', 'adptr_opts',
+                 'context_key', '_hash')
+
+    def __init__(self, ctx_create_opts, ctx_opts, adptr_opts):
+        self.ctx_create_opts = _freeze(ctx_create_opts)
+        self.ctx_opts = _freeze(ctx_opts)
+        self.adptr_opts = _freeze(adptr_opts)
+        self.context_key = (self.ctx_create_opts, self.ctx_opts)
+        self._hash = hash((self.context_key, self.adptr_opts))
+
+    def __eq__(self, other):
+        return (isinstance(other, CompiledSslConfig) and
+                self._hash == other._hash and
+                self.context_key == other.context_key and
+                self.adptr_opts == other.adptr_opts)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def to_opts(self):
+        """
+        New dicts of options, as returned by
+        :meth:`SslContextAdapter.ssl_config_to_context_opts`
+        :rtype: tuple
+        """
+        adptr_opts = dict(self.adptr_opts)
+        adptr_opts['socket_options'] = list(adptr_opts['socket_options'])
+        return dict(self.ctx_create_opts), dict(self.ctx_opts), adptr_opts
+
+
+def compile_ssl_config(config):
+    """
+    Get, or compile and cache, adapter options of an SslConfig
+    :param config: SslConfig or dict representation
+    :type  config: SslConfig | dict
+    :rtype: CompiledSslConfig
+    """
+    if isinstance(config, SslConfig):
+        config = config.to_dict()
+    if not isinstance(config, dict):
+        raise TypeError("SSL config not defined as dictionary")
+    key = _freeze(config)
+    compiled = compiled_ssl_config_cache.get(key, None)
+    if compiled is None:
+        compiled = CompiledSslConfig(
+            *SslContextAdapter.compile_context_opts(config))
+        if len(compiled_ssl_config_cache) >= COMPILED_SSL_CONFIG_CACHE_MAX:
+            compiled_ssl_config_cache.clear()  # e.g. many edited configs
+        compiled_ssl_config_cache[key] = compiled
+    return compiled
+
+
+def ssl_context_key(ctx_create_opts, ctx_opts):
+    """
+    Hashable key for SSL context options, as returned by
+    :meth:`SslContextAdapter.ssl_config_to_context_opts`
+    :rtype: tuple
+    """
+    return (tuple(sorted(ctx_create_opts.items())),
+            tuple(sorted(ctx_opts.items())))
+
+
+def cached_ssl_context(ctx_create_opts, ctx_opts):
+    """
+    Get, or build and cache, an SSL context for context options
+    :rtype: ssl.SSLContext
+    """
+    key = ssl_context_key(ctx_create_opts, ctx_opts)
+    return cached_ssl_context_for_key(key, ctx_create_opts, ctx_opts)
+
+
+def cached_ssl_context_for_key(key, ctx_create_opts, ctx_opts):
+    """
+    :param key: Context key of the options, e.g. CompiledSslConfig.context_key
+    :rtype: ssl.SSLContext
+    """
+    context = ssl_context_cache.get(key, None)
+    if context is None:
+        with _ssl_context_cache_lock:
+            context = ssl_context_cache.get(key, None)
+            if context is None:
+                stamp = pki_files_stamp(ctx_opts)
+                context = SslContextAdapter.build_context(ctx_create_opts,
+                                                          ctx_opts)
+                ssl_context_cache[key] = context
+                ssl_context_file_stamps[key] = stamp
+    return context
+
+
+def pki_files_stamp(ctx_opts):
+    """
+    Modification stamp of PKI files referenced by SSL context options
+    :rtype: tuple
+    """
+    stamp = []
+    for opt in ('cafile', 'certfile', 'keyfile'):
+        path = ctx_opts.get(opt, None)
+        if not path:
+            continue
+        try:
+            st = os.stat(path)
+            stamp.append((path, st.st_mtime, st.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+
+def refresh_ssl_context_cache():
+    """
+    Rebuild cached SSL contexts whose PKI files have changed on disk.
+
+    A context that fails to build (e.g. a renewed cert copied before its key)
+    is left in place and retried upon the next refresh.
+
+    :return: Rebuilt contexts, keyed by context key
+    :rtype: dict
+    """
+    refreshed = dict()
+    for key, old_stamp in list(ssl_context_file_stamps.items()):
+        ctx_create_opts, ctx_opts = dict(key[0]), dict(key[1])
+        stamp = pki_files_stamp(ctx_opts)
+        if stamp == old_stamp:
+            continue
+        try:
+            context = SslContextAdapter.build_context(ctx_create_opts,
+                                                      ctx_opts)
+        except (SSLError, IOError) as e:
+            logger.error(u'Could not rebuild SSL context for changed PKI '
+                         u'files {0}: {1}'.format([p[0] for p in stamp], e))
+            continue
+        with _ssl_context_cache_lock:
+            if key in ssl_context_cache:
+                ssl_context_cache[key] = context
+                ssl_context_file_stamps[key] = stamp
+                refreshed[key] = context
+        logger.info(u'SSL context rebuilt for changed PKI files: {0}'
+                    .format([p[0] for p in stamp]))
+    return refreshed
+
+
+def prune_ssl_context_cache(keep_keys):
+    """
+    Remove cached SSL contexts whose keys are not in keep_keys
+    :return: Number of contexts removed
+    :rtype: int
+    """
+    with _ssl_context_cache_lock:
+        stale = [k for k in ssl_context_cache if k not in keep_keys]
+        for k in stale:
+            del ssl_context_cache[k]
+            ssl_context_file_stamps.pop(k, None)
+    return len(stale)
+
+
+def reset_ssl_context_cache_lock():
+    """Replace lock, which may have been held by a thread at fork time"""
+    global _ssl_context_cache_lock
+    _ssl_context_cache_lock = threading.Lock()
+
+
+def release_proxy_manager(key):
+    """
+    Release an adapter's use of a cached proxy manager
+    :return: Whether the manager is no longer used, so can be cleared
+    :rtype: bool
+    """
+    with _proxy_manager_cache_lock:
+        entry = proxy_manager_cache.get(key, None)
+        if entry is None:
+            return True
+        entry[1] -= 1
+        if entry[1] > 0:
+            return False
+        del proxy_manager_cache[key]
+        return True
+
+
+def reset_proxy_manager_cache_lock():
+    """Replace lock, which may have been held by a thread at fork time"""
+    global _proxy_manager_cache_lock
+    _proxy_manager_cache_lock = threading.Lock()
+
+
 class SslContextAdapter(HTTPAdapter):
     """
     A requests TransportAdapter that enables manipulation of its SSL context.
@@ -83,11 +325,45 @@ class SslContextAdapter(HTTPAdapter):
         https_redirects=3
           accepts: None, int >= 0 or False
           (0 does not redirect; False does the same, but skips rasising)
+        socket_options=[(IPPROTO_TCP, TCP_NODELAY, 1)]
+          accepts: list of (level, option, value) for socket.setsockopt,
+          built from SslConfig TCP keepalive, no delay and buffer settings
+        timeout_connect=None, timeout_read=None, timeout_total=None
+          accepts: None or seconds; defaults and ceilings of request timeouts
+        proxy=None
+          accepts: None or http(s)://[user:pass@]host:port URL of a forward
+          proxy to tunnel (CONNECT) all requests through, instead of any
+          proxies passed to send(), e.g. from the environment
+        hedge=None
+          accepts: None or (percentile, budget percent) of a HedgePolicy for
+          GET and HEAD requests
+        bulkhead=None
+          accepts: None or (max concurrent, queue size, queue timeout) of a
+          Bulkhead limiting /pki/ requests in flight
     """
+
+    hedge_methods = ('GET', 'HEAD')
+
     def __init__(self, url, *args, **kwargs):
 
+        ssl_config = self.get_ssl_config(url)
+        # For introspection of which SslConfig an adapter was built from
+        self.ssl_config_id = ssl_config.pk
+        self.ssl_config_name = ssl_config.name
+
+        self._compiled = compile_ssl_config(ssl_config)
         self._ctx_create_opts, self._ctx_opts, self._adptr_opts = \
-            self.get_ssl_context_opts(url)
+            self._compiled.to_opts()
+
+        # proxy URL -> proxy_manager_cache key of managers in use
+        self._proxy_manager_keys = dict()
+
+        # Per adapter, i.e. per upstream hostname:port, response times
+        _hedge = self._adptr_opts.get('hedge', None)
+        self.hedge_policy = HedgePolicy(*_hedge) if _hedge else None
+        # Per adapter, i.e. per upstream hostname:port, concurrency limit
+        _bulkhead = self._adptr_opts.get('bulkhead', None)
+        self.bulkhead = Bulkhead(*_bulkhead) if _bulkhead else None
 
         # set up adapter options
         _retries = self._adptr_opts.get('retries', None)
@@ -111,15 +387,14 @@ class SslContextAdapter(HTTPAdapter):
         :param url: A URL
         :rtype: basestring
         """
-        parts = urlparse(url)
-        return re.sub(parts.hostname, parts.hostname, url, count=1, flags=re.I)
+        return normalize_hostname(url)
 
     @staticmethod
-    def get_ssl_context_opts(url):
+    def get_ssl_config(url):
         """
         :param url: URL or base URL, e.g. https://mydomain:8000
         :type url: basestring
-        :return: tuple of dicts that matches input for SslContextAdapter
+        :rtype: SslConfig
         """
 
         ssl_config = ssl_config_for_url(url)
@@ -129,7 +404,17 @@ class SslContextAdapter(HTTPAdapter):
             raise SslContextAdapterError(
                 'Could not retrieve SslConfig for URL: {0}'.format(url))
 
-        return SslContextAdapter.ssl_config_to_context_opts(ssl_config)
+        return ssl_config
+
+    @staticmethod
+    def get_ssl_context_opts(url):
+        """
+        :param url: URL or base URL, e.g. https://mydomain:8000
+        :type url: basestring
+        :return: tuple of dicts that matches input for SslContextAdapter
+        """
+        return SslContextAdapter.ssl_config_to_context_opts(
+            SslContextAdapter.get_ssl_config(url))
 
     def context_options(self):
         """
@@ -138,22 +423,88 @@ class SslContextAdapter(HTTPAdapter):
         """
         return self._ctx_create_opts, self._ctx_opts, self._adptr_opts
 
-    def _update_context(self, context):
+    def compiled_config(self):
+        """
+        Compiled options of the SslConfig the adapter was built from
+        :rtype: CompiledSslConfig
+        """
+        return self._compiled
+
+    def context_key(self):
+        """Hashable key of adapter's SSL context options"""
+        return self._compiled.context_key
+
+    def ssl_context(self):
+        """
+        Shared SSL context for adapter's options, built once per process
+        (or inherited from a pre-forking parent process)
+        :rtype: ssl.SSLContext
+        """
+        return cached_ssl_context_for_key(
+            self._compiled.context_key, self._ctx_create_opts, self._ctx_opts)
+
+    def pool_managers(self):
+        """
+        Adapter's pool manager and any proxy managers, keyed by proxy URL
+        (None for the direct pool manager)
+        :rtype: dict
+        """
+        managers = {None: self.poolmanager}
+        managers.update(self.proxy_manager)
+        return managers
+
+    def swap_ssl_context(self, context):
+        """
+        Use a (rebuilt) SSL context for all new connections of the adapter.
+
+        Connections already established keep their TLS session and drain
+        gracefully; pooled connections pick up the context when they next
+        (re)connect.
+
+        urllib3 keys pools by SSL context, so live pools are patched in place,
+        rather than replaced by new pools (orphaning them). A manager's own
+        context, which new pools are built with, is only swapped while it has
+        no pools; :meth:`close` syncs it once its pools are disposed of.
+
+        :type context: ssl.SSLContext
+        """
+        for manager in self.pool_managers().values():
+            if not len(manager.pools):
+                manager.connection_pool_kw['ssl_context'] = context
+                continue
+            for pool_key in manager.pools.keys():
+                pool = manager.pools.get(pool_key)
+                if pool is not None and 'ssl_context' in pool.conn_kw:
+                    pool.conn_kw['ssl_context'] = context
+
+    @staticmethod
+    def build_context(ctx_create_opts, ctx_opts):
+        """
+        Build a new urllib3 connection context with SSL options
+        :rtype: ssl.SSLContext
+        """
+        context = create_urllib3_context(**ctx_create_opts)
+        SslContextAdapter._update_context(context, ctx_opts)
+        return context
+
+    @staticmethod
+    def _update_context(context, ctx_opts):
         """
         Update the urllib3 connection context with SSL options
 
         :type context: ssl.SSLContext
+        :type ctx_opts: dict
         """
-        cafile = self._ctx_opts.get('cafile', None)
+        cafile = ctx_opts.get('cafile', None)
         if cafile:
             context.load_verify_locations(cafile=cafile)
         else:
             # TODO: Will loaded defaults be overridden later by socket wrap?
             context.load_default_certs(purpose=Purpose.SERVER_AUTH)
 
-        certfile = self._ctx_opts.get('certfile', None)
-        keyfile = self._ctx_opts.get('keyfile', None)
-        password = self._ctx_opts.get('password', None)
+        certfile = ctx_opts.get('certfile', None)
+        keyfile = ctx_opts.get('keyfile', None)
+        password = ctx_opts.get('password', None)
         supports_password = True
         if certfile and keyfile:
             # if password:  # for debugging
@@ -189,18 +540,56 @@ class SslContextAdapter(HTTPAdapter):
                     raise SSLError(msg)
 
     def init_poolmanager(self, *args, **kwargs):
-        context = create_urllib3_context(**self._ctx_create_opts)
-        self._update_context(context)
-        kwargs['ssl_context'] = context
-        return super(SslContextAdapter, self).init_poolmanager(*args,
-                                                               **kwargs)
-
-    def proxy_manager_for(self, *args, **kwargs):
-        context = create_urllib3_context(**self._ctx_create_opts)
-        self._update_context(context)
-        kwargs['ssl_context'] = context
-        return super(SslContextAdapter, self).proxy_manager_for(*args,
-                                                                **kwargs)
+        kwargs['ssl_context'] = self.ssl_context()
+        kwargs['socket_options'] = self._adptr_opts['socket_options']
+        super(SslContextAdapter, self).init_poolmanager(*args, **kwargs)
+        # Pools report to the process-wide idle reaper and socket cap
+        use_pki_pools(self.poolmanager)
+
+    def proxy_manager_key(self, proxy):
+        """
+        Hashable key of a proxy manager for proxy and adapter's options; equal
+        for adapters of the same SslConfig
+        :rtype: tuple
+        """
+        return (proxy, self._compiled,
+                self._pool_connections, self._pool_maxsize, self._pool_block)
+
+    def proxy_manager_for(self, proxy, **kwargs):
+        if proxy in self.proxy_manager:
+            return self.proxy_manager[proxy]
+        key = self.proxy_manager_key(proxy)
+        with _proxy_manager_cache_lock:
+            entry = proxy_manager_cache.get(key, None)
+            if entry is None:
+                kwargs['ssl_context'] = self.ssl_context()
+                kwargs['socket_options'] = self._adptr_opts['socket_options']
+                manager = use_pki_pools(
+                    super(SslContextAdapter, self).proxy_manager_for(
+                        proxy, **kwargs))
+                entry = proxy_manager_cache[key] = [manager, 0]
+            else:
+                self.proxy_manager[proxy] = entry[0]
+            entry[1] += 1
+            self._proxy_manager_keys[proxy] = key
+        return entry[0]
+
+    def close(self):
+        """
+        Dispose of adapter's pools; shared proxy managers are only cleared
+        once no other adapter uses them
+        """
+        context = self.ssl_context()
+        self.poolmanager.clear()
+        # New pools are built with any context swapped in meanwhile
+        self.poolmanager.connection_pool_kw['ssl_context'] = context
+        for proxy, manager in list(self.proxy_manager.items()):
+            key = self._proxy_manager_keys.pop(proxy, None)
+            if release_proxy_manager(key):
+                manager.clear()
+                manager.connection_pool_kw['ssl_context'] = context
+        # Reacquired if adapter is used again, e.g. after a fork reset
+        self.proxy_manager.clear()
 
     # **kwargs doesn't work here; requests' send() calls 'proxies' positionally
     def get_connection(self, url, proxies=None):
@@ -212,9 +601,140 @@ class SslContextAdapter(HTTPAdapter):
         request.url = self._normalize_hostname(request.url)
         return super(SslContextAdapter, self).request_url(request, proxies)
 
+    def resolve_timeout(self, timeout=None):
+        """
+        Apply SslConfig timeouts as defaults and ceilings of a request's
+        timeout, i.e. a request can shorten, but never lengthen, them.
+
+        :param timeout: None, seconds, or (connect, read) tuple, as accepted
+          by requests; a urllib3 Timeout object is returned unchanged
+        :rtype: tuple | urllib3.util.Timeout
+        """
+        if timeout is not None and not isinstance(timeout, (tuple, list,
+                                                            int, float)):
+            return timeout
+        if isinstance(timeout, (tuple, list)):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        total = self._adptr_opts.get('timeout_total', None)
+        return (
+            min_timeout(connect, self._adptr_opts.get('timeout_connect', None),
+                        total),
+            min_timeout(read, self._adptr_opts.get('timeout_read', None),
+                        total),
+        )
+
+    def hedgeable(self, request):
+        """
+        Whether a request may be hedged: idempotent, with no (streamed) body
+        :type request: requests.PreparedRequest
+        :rtype: bool
+        """
+        return (self.hedge_policy is not None and
+                request.method in self.hedge_methods and
+                not request.body)
+
+    @staticmethod
+    def parsed_url(request):
+        """
+        Request's ParsedUrl, as set by SslContextSession.send, or parsed anew
+        if the request's URL has since changed
+        :type request: requests.PreparedRequest
+        :rtype: ParsedUrl
+        """
+        url = getattr(request, 'pki_url', None)
+        if url is None or url.url != request.url:
+            url = request.pki_url = ParsedUrl(request.url)
+        return url
+
+    @staticmethod
+    def replayable(request):
+        """
+        Whether a request's body can be resent upon a retry; streamed bodies,
+        e.g. a client upload being forwarded, can only be read once (urllib3
+        rewinds seekable files)
+        :type request: requests.PreparedRequest
+        :rtype: bool
+        """
+        body = request.body
+        return (body is None or isinstance(body, basestring) or  # noqa
+                hasattr(body, 'seek'))
+
+    def without_retries(self):
+        """
+        Shallow copy of adapter, sharing its pool managers, that does not
+        retry requests
+        :rtype: SslContextAdapter
+        """
+        adptr = object.__new__(self.__class__)
+        adptr.__dict__.update(self.__dict__)
+        adptr.max_retries = Retry(0, read=False)
+        return adptr
+
     def send(self, request, **kwargs):
-        request.url = self._normalize_hostname(request.url)
-        return super(SslContextAdapter, self).send(request, **kwargs)
+        request.url = self.parsed_url(request).url
+        proxy = self._adptr_opts.get('proxy', None)
+        if proxy:
+            # SslConfig's egress proxy wins over environment proxies
+            kwargs['proxies'] = {'https': proxy, 'http': proxy}
+        kwargs['timeout'] = self.resolve_timeout(kwargs.get('timeout', None))
+        total = self._adptr_opts.get('timeout_total', None)
+        start = time.time()
+        if self.hedgeable(request):
+            resp = send_hedged(self.hedge_policy,
+                               super(SslContextAdapter, self).send,
+                               request, **kwargs)
+        elif not self.replayable(request):
+            resp = super(SslContextAdapter, self.without_retries()).send(
+                request, **kwargs)
+        else:
+            resp = super(SslContextAdapter, self).send(request, **kwargs)
+        elapsed = time.time() - start
+        if total is not None:
+            if elapsed > total:
+                # e.g. slow headers, or retries each within read timeout
+                resp.close()
+                raise DeadlineExceeded(
+                    'Upstream response exceeded total deadline of {0}s '
+                    '(after {1:.3f}s): {2}'.format(total, elapsed,
+                                                   request.url),
+                    request=request)
+            # Remainder of deadline, for relaying response body
+            resp.pki_deadline = start + total
+        return resp
+
+    @staticmethod
+    def ssl_config_to_socket_options(config):
+        """
+        Convert socket tuning values of an SslConfig dict representation to
+        urllib3 socket_options, i.e. (level, option, value) tuples.
+
+        Keepalive values unsupported by the platform's socket module are
+        skipped (SslConfig.clean() reports them to the admin).
+
+        :type config: dict
+        :rtype: list
+        """
+        sock_opts = []
+        # Absent value means urllib3's default of TCP_NODELAY enabled
+        if config.get('tcp_nodelay', True):
+            sock_opts.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+        if config.get('tcp_keepalive', False):
+            sock_opts.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            # noinspection PyProtectedMember
+            for attr, names, _, _ in SslConfig._tcp_keepalive_opts:
+                val = config.get(attr, None)
+                const = SslConfig.tcp_keepalive_constant(names)
+                if val is not None and const is not None:
+                    sock_opts.append((socket.IPPROTO_TCP, const, int(val)))
+        # noinspection PyProtectedMember
+        for attr, name in SslConfig._socket_buffer_opts:
+            val = config.get(attr, None)
+            if val is not None:
+                sock_opts.append(
+                    (socket.SOL_SOCKET, getattr(socket, name), int(val)))
+        return sock_opts
 
     @staticmethod
     def ssl_config_to_context_opts(config):
@@ -226,11 +746,17 @@ class SslContextAdapter(HTTPAdapter):
         :type  config: SslConfig | dict
         :rtype: dict
         """
-        if isinstance(config, SslConfig):
-            config = config.to_dict()
+        return compile_ssl_config(config).to_opts()
 
-        if not isinstance(config, dict):
-            raise TypeError("SSL config not defined as dictionary")
+    @staticmethod
+    def compile_context_opts(config):
+        """
+        Uncached conversion for :meth:`ssl_config_to_context_opts`; use
+        :func:`compile_ssl_config` instead.
+
+        :type config: dict
+        :rtype: tuple
+        """
         if 'name' not in config:
             raise KeyError("SSL config does not have a name property")
 
@@ -243,15 +769,10 @@ class SslContextAdapter(HTTPAdapter):
         ssl_opts = config.get('ssl_options', None)
         opts = 0
         if ssl_opts and isinstance(ssl_opts, list):
-            # ssl OP_* enums are dynamically loaded from OpenSSL, so verify
-            # they are present in ssl module before bitwise appending them
-            op_opts = [o for o in dir(ssl) if o.startswith('OP_')]
-            for opt in ssl_opts:
-                if opt in op_opts:
-                    opts |= getattr(ssl, opt)
-                else:
-                    # TODO: Log (don't raise) unresolvable options, for admin
-                    pass
+            # ssl OP_* enums are dynamically loaded from OpenSSL, so only
+            # those present in ssl module are bitwise appended
+            # TODO: Log (don't raise) unresolvable options, for admin
+            opts = ssl_constants.options_value(ssl_opts)
         ctx_c_opts['options'] = opts if opts else None
         ctx_c_opts['ciphers'] = config.get('ssl_ciphers', None)
 
@@ -279,6 +800,23 @@ class SslContextAdapter(HTTPAdapter):
             config.get('https_retries', None))
         adptr_opts['redirects'] = _redo_value(
             config.get('https_redirects', None))
+        adptr_opts['socket_options'] = \
+            SslContextAdapter.ssl_config_to_socket_options(config)
+        for opt in ('timeout_connect', 'timeout_read', 'timeout_total'):
+            val = config.get(opt, None)
+            adptr_opts[opt] = float(val) if val is not None else None
+        adptr_opts['proxy'] = config.get('egress_proxy', None) or None
+        adptr_opts['hedge'] = (
+            int(config.get('hedge_percentile', None) or 95),
+            int(config.get('hedge_budget', None) or 5),
+        ) if config.get('hedge_requests', False) else None
+        max_concurrent = config.get('max_concurrent', None)
+        queue_timeout = config.get('queue_timeout', None)
+        adptr_opts['bulkhead'] = (
+            int(max_concurrent),
+            int(config.get('queue_size', None) or 0),
+            float(queue_timeout) if queue_timeout is not None else None,
+        ) if max_concurrent else None
 
         # logger.debug("ctx_c_opts: \n{0}".format(ctx_c_opts))
         # logger.debug("ctx_opts: \n{0}".format(ctx_opts))
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import ssl
+
+from collections import OrderedDict
+
+
+class SslConstants(object):
+    """
+    Registry of ssl module PROTOCOL_*, CERT_* and OP_* constants, by name.
+
+    The constants are dynamically loaded from OpenSSL, so vary by platform;
+    they are looked up once, instead of scanning dir(ssl) upon every use.
+
+    :param module: Module to collect constants from
+    """
+    def __init__(self, module=ssl):
+        names = dir(module)
+
+        def collect(prefix):
+            return OrderedDict(
+                (n, getattr(module, n)) for n in names if n.startswith(prefix))
+
+        self.protocols = collect('PROTOCOL_')
+        self.verify_modes = collect('CERT_')
+        self.options = collect('OP_')
+
+    def options_value(self, names):
+        """
+        Bitwise OR of known OP_* option names; unknown names are skipped
+        :type names: list[str]
+        :rtype: int
+        """
+        value = 0
+        for name in names:
+            value |= self.options.get(name, 0)
+        return value
+
+    def unknown_options(self, names):
+        """
+        :type names: list[str]
+        :return: Names that are not OP_* options on this platform
+        :rtype: list[str]
+        """
+        return [n for n in names if n not in self.options]
+
+
+# global, built once at import
+ssl_constants = SslConstants()
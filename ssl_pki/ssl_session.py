@@ -18,8 +18,14 @@
 #
 #########################################################################
 
+import os
+import time
 import logging
+import threading
 
+from collections import OrderedDict, deque, namedtuple
+from Queue import Queue
+from ssl import SSLError
 from requests import Session
 from requests.adapters import HTTPAdapter
 from requests.exceptions import InvalidSchema
@@ -38,13 +44,38 @@ except ImportError:
     pyopenssl = None
     IS_PYOPENSSL = None
 
-from .models import has_ssl_config
-from .utils import requests_base_url, normalize_hostname
-from .ssl_adapter import SslContextAdapter
+from .models import (
+    has_ssl_config,
+    rebuild_hostnameport_pattern_cache,
+    HostnamePortSslConfig,
+)
+from .pools import pool_manager_stats, registry_stats
+from .cache import response_cache
+from .coalesce import coalescer
+from .pools import reset_after_fork as reset_pools_after_fork
+from .settings import FILE_CHECK_INTERVAL, FANOUT_MAX_WORKERS, FANOUT_PER_HOST
+from .utils import ParsedUrl, parse_url
+from .ssl_adapter import (
+    SslContextAdapter,
+    ssl_context_cache,
+    cached_ssl_context,
+    refresh_ssl_context_cache,
+    reset_proxy_manager_cache_lock,
+    reset_ssl_context_cache_lock,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# When PKI files were last checked for changes, and guard so only one
+# request thread does the checking
+_pki_files_checked = time.time()
+_pki_files_lock = threading.Lock()
+
+# Outcome of one request of a SslContextSession.gather() fan-out
+FanOutResult = namedtuple(
+    'FanOutResult', ['index', 'request', 'response', 'error', 'elapsed'])
+
 
 class SslContextSession(Session):
     """
@@ -59,6 +90,9 @@ class SslContextSession(Session):
 
         super(SslContextSession, self).__init__()
 
+        # Guards against concurrent requests mounting duplicate adapters
+        self._mount_lock = threading.RLock()
+
         # Clear default, fallback 'https://' adapter;
         # all https adapters in our session MUST be unique to a fqdn[:port]
         # It's up to admin what (if any) adapter gets mapped to all https
@@ -80,8 +114,8 @@ class SslContextSession(Session):
         # which says matches should be case-insensitive (this is a bug):
         #   https://tools.ietf.org/html/rfc5280#section-4.2.1.6
         #   https://tools.ietf.org/html/rfc6125 <-- best practices
-        # normalize_hostname() handles this bug
-        base_url = requests_base_url(normalize_hostname(url))
+        # ParsedUrl normalizes the hostname, handling this bug
+        base_url = parse_url(url).base_url
 
         try:
             self.get_adapter(base_url)
@@ -89,27 +123,341 @@ class SslContextSession(Session):
             # logger.debug(u'Using session SslContextAdapter for {0}'
             #              .format(base_url))
         except InvalidSchema:
-            # TODO: via_query=True here *may* cause excessive db calls; if so,
-            #       it can be False, but then returned value is dependent upon
-            #       whether pattern cache has been recently updated on host.
-            if has_ssl_config(base_url, via_query=True):
-                self.mount(base_url, SslContextAdapter(base_url))
-                logger.info(u'SslContext Session adapter added for {0}'
-                            .format(base_url))
-            else:
-                self.mount(base_url, HTTPAdapter())
-                logger.debug(u'Base HTTP session adapter add {0}'
-                             .format(base_url))
+            with self._mount_lock:
+                try:
+                    self.get_adapter(base_url)
+                    return  # mounted by another thread meanwhile
+                except InvalidSchema:
+                    pass
+                # TODO: via_query=True here *may* cause excessive db calls; if
+                #       so, it can be False, but then returned value is
+                #       dependent upon whether pattern cache has been recently
+                #       updated on host.
+                if has_ssl_config(base_url, via_query=True):
+                    self.mount(base_url, SslContextAdapter(base_url))
+                    logger.info(u'SslContext Session adapter added for {0}'
+                                .format(base_url))
+                else:
+                    self.mount(base_url, HTTPAdapter())
+                    logger.debug(u'Base HTTP session adapter add {0}'
+                                 .format(base_url))
 
     def send(self, request, **kwargs):
         # Setting up the adapter just before sending allows adapters to be
         # added during yielded redirects in Session.resolve_redirects(...)
         # This is critical for redirects also requiring SslConfigs, e.g. PKI
         if request.url.lower().startswith('https'):
-            self.mount_sslcontext_adapter(request.url)
+            reload_pki_files_if_due()
+            # Parsed once, for this session's and the adapter's use
+            url = request.pki_url = ParsedUrl(request.url)
+            request.url = url.url
+            self.mount_sslcontext_adapter(url)
 
         return super(SslContextSession, self).send(request, **kwargs)
 
+    def upstream_bulkhead(self, url):
+        """
+        Concurrency limit of requests to a URL's upstream hostname:port, per
+        its SslConfig's max concurrent requests
+        :rtype: ssl_pki.bulkhead.Bulkhead | None
+        """
+        if not url.lower().startswith('https'):
+            return None
+        url = parse_url(url)
+        self.mount_sslcontext_adapter(url)
+        return getattr(self.get_adapter(url.base_url), 'bulkhead', None)
+
+    @staticmethod
+    def _fanout_request(req):
+        """Normalize a fan-out request: URL, or dict of request kwargs"""
+        if isinstance(req, basestring):  # noqa
+            return {'method': 'GET', 'url': req}
+        req = dict(req)
+        req.setdefault('method', 'GET')
+        if 'url' not in req:
+            raise ValueError('Fan-out request has no url: {0}'.format(req))
+        return req
+
+    def _gather_one(self, req, process=None):
+        resp = self.request(**req)
+        return process(resp) if process is not None else resp
+
+    def iter_gather(self, reqs, max_workers=None, per_host=None,
+                    process=None, guard=None):
+        """
+        Dispatch a batch of requests over a bounded pool of threads, yielding
+        results as each completes. Per-host adapters (and so their connection
+        pools and SslConfigs) are reused as with any session request.
+
+        :param reqs: URL strings (for GET) or dicts of kwargs for request();
+          an invalid one, e.g. without a url, fails in its own result
+        :param max_workers: Max concurrent requests overall
+          (default: settings.PKI_FANOUT_MAX_WORKERS)
+        :param per_host: Max concurrent requests to any one hostname:port, so
+          a batch can not exhaust one upstream's pool
+          (default: settings.PKI_FANOUT_PER_HOST)
+        :param process: Optional callable given each response in its worker
+          thread, e.g. to read a streamed body there, while holding the
+          host's slot; its return value replaces the response in the result,
+          and any exception it raises is set as the result's error
+        :param guard: Optional callable given each request's kwargs in its
+          worker thread, returning a context manager (or None) held while
+          the request is sent and processed, e.g. an upstream's concurrency
+          slot; any exception it raises is set as the result's error
+        :rtype: collections.Iterable[FanOutResult]
+        """
+        reqs = list(reqs)
+        if not reqs:
+            return
+        max_workers = max_workers or FANOUT_MAX_WORKERS
+        per_host = per_host or FANOUT_PER_HOST
+        done = Queue()
+
+        # Per-host queues, so workers only dequeue requests to hosts with a
+        # free slot, rather than stalling on a saturated host
+        work = OrderedDict()
+        for index, req in enumerate(reqs):
+            try:
+                req = self._fanout_request(req)
+                host = ParsedUrl(req['url']).hostname_port
+            except Exception as e:
+                # An invalid request fails on its own, as in its worker
+                done.put(FanOutResult(index, req, None, e, 0.0))
+                continue
+            work.setdefault(host, deque()).append((index, req))
+        active = dict((host, 0) for host in work)
+        ready = threading.Condition()
+
+        def next_request():
+            with ready:
+                while any(work.values()):
+                    for host, pending in work.items():
+                        if pending and active[host] < per_host:
+                            active[host] += 1
+                            return host, pending.popleft()
+                    ready.wait()
+                return None, None
+
+        def worker():
+            while True:
+                host, item = next_request()
+                if item is None:
+                    return
+                i, r = item
+                start = time.time()
+                resp, error = None, None
+                try:
+                    held = guard(r) if guard is not None else None
+                    if held is None:
+                        resp = self._gather_one(r, process)
+                    else:
+                        with held:
+                            resp = self._gather_one(r, process)
+                except Exception as e:
+                    error = e
+                with ready:
+                    active[host] -= 1
+                    ready.notify_all()
+                done.put(FanOutResult(i, r, resp, error, time.time() - start))
+
+        for _ in range(min(max_workers, len(reqs))):
+            t = threading.Thread(target=worker, name='ssl_pki-fanout')
+            t.daemon = True
+            t.start()
+
+        for _ in range(len(reqs)):
+            yield done.get()
+
+    def gather(self, reqs, max_workers=None, per_host=None):
+        """
+        Dispatch a batch of requests concurrently; see :meth:`iter_gather`.
+        Errors do not raise, but are set per request result.
+
+        :return: Results, in the same order as reqs
+        :rtype: list[FanOutResult]
+        """
+        results = [None] * len(reqs)
+        for result in self.iter_gather(reqs, max_workers=max_workers,
+                                       per_host=per_host):
+            results[result.index] = result
+        return results
+
 
 # global, so base_url -> adapter registrations are cached across calls
 https_client = SslContextSession()
+
+
+def adapter_stats(base_url, adptr):
+    """
+    :type base_url: basestring
+    :type adptr: HTTPAdapter
+    :rtype: dict
+    """
+    stats = {
+        'base_url': base_url,
+        'adapter': adptr.__class__.__name__,
+        'ssl_config': None,
+        # noinspection PyProtectedMember
+        'pool_connections': getattr(adptr, '_pool_connections', None),
+        # noinspection PyProtectedMember
+        'pool_maxsize': getattr(adptr, '_pool_maxsize', None),
+        'pools': [],
+        'proxy_pools': {},
+    }
+    if isinstance(adptr, SslContextAdapter):
+        stats['ssl_config'] = {
+            'id': adptr.ssl_config_id,
+            'name': adptr.ssl_config_name,
+        }
+        if adptr.hedge_policy is not None:
+            stats['hedging'] = adptr.hedge_policy.stats()
+        if adptr.bulkhead is not None:
+            stats['bulkhead'] = adptr.bulkhead.stats()
+    if getattr(adptr, 'poolmanager', None) is not None:
+        stats['pools'] = pool_manager_stats(adptr.poolmanager)
+    for proxy, manager in getattr(adptr, 'proxy_manager', {}).items():
+        stats['proxy_pools'][proxy] = pool_manager_stats(manager)
+    return stats
+
+
+def pool_stats(session=None):
+    """
+    Snapshot of a session's adapters and their connection pools, plus the
+    process-wide connection registry, response cache and request
+    coalescing, e.g. for tuning pool and cache sizes.
+
+    :type session: SslContextSession
+    :rtype: dict
+    """
+    if session is None:
+        session = https_client
+    return {
+        'pid': os.getpid(),
+        'connections': registry_stats(),
+        'ssl_contexts': len(ssl_context_cache),
+        'response_cache': response_cache.stats(),
+        'coalescing': coalescer.stats(),
+        'adapters': [adapter_stats(base_url, adptr)
+                     for base_url, adptr in list(session.adapters.items())],
+    }
+
+
+def reload_pki_files(session=None):
+    """
+    Rebuild SSL contexts whose PKI files (CA certs, client certs or keys)
+    have changed on disk, and swap them into the session's adapters that use
+    them. Connection pools are kept (and patched in place); only new
+    connections use the rebuilt contexts, while existing connections drain.
+
+    :type session: SslContextSession
+    :return: Number of adapters updated
+    :rtype: int
+    """
+    if session is None:
+        session = https_client
+    refreshed = refresh_ssl_context_cache()
+    if not refreshed:
+        return 0
+    updated = 0
+    for base_url, adptr in list(session.adapters.items()):
+        if not isinstance(adptr, SslContextAdapter):
+            continue
+        context = refreshed.get(adptr.context_key(), None)
+        if context is not None:
+            adptr.swap_ssl_context(context)
+            updated += 1
+            logger.info(u'SslContextAdapter using rebuilt SSL context: {0}'
+                        .format(base_url))
+    return updated
+
+
+def reload_pki_files_if_due():
+    """
+    Check PKI files for changes, at most every PKI_FILE_CHECK_INTERVAL secs.
+    Cheap enough to call on every request; other threads never wait on it.
+    """
+    global _pki_files_checked
+    if not FILE_CHECK_INTERVAL or \
+            time.time() - _pki_files_checked < FILE_CHECK_INTERVAL:
+        return
+    if not _pki_files_lock.acquire(False):
+        return
+    try:
+        _pki_files_checked = time.time()
+        reload_pki_files()
+    except Exception as e:
+        logger.error(u'Could not check PKI files for changes: {0}'.format(e))
+    finally:
+        _pki_files_lock.release()
+
+
+def preload_ssl_contexts():
+    """
+    Parse CA bundles and client cert chains, and build SSL contexts, for all
+    mapped SslConfigs, ahead of any connections.
+
+    Call in a pre-forking server's master process (e.g. at the end of the WSGI
+    module with gunicorn --preload), so workers share the built contexts
+    copy-on-write, instead of each building them on first connection.
+
+    :return: Number of SSL contexts available in the cache
+    :rtype: int
+    """
+    rebuild_hostnameport_pattern_cache()
+    built = set()
+    for ptn, config in \
+            HostnamePortSslConfig.objects.mapped_ssl_configs().items():
+        ctx_c_opts, ctx_opts, _ = \
+            SslContextAdapter.ssl_config_to_context_opts(config)
+        try:
+            cached_ssl_context(ctx_c_opts, ctx_opts)
+            built.add(config.pk)
+        except SSLError as e:
+            logger.error(u'Could not preload SSL context for {0}: {1}'
+                         .format(ptn, e))
+    logger.info(u'Preloaded SSL contexts for {0} SslConfig(s)'
+                .format(len(built)))
+    return len(built)
+
+
+def reset_after_fork():
+    """
+    Reset per-process https_client state in a newly forked worker.
+
+    Connection pools inherited from the parent share sockets with it, so they
+    are closed; adapters stay mounted and preloaded SSL contexts are kept, so
+    only the pools are rebuilt, lazily, upon the worker's first connections.
+
+    Locks of per-process state (caches, coalescer, and adapters' hedge
+    policies and bulkheads) are replaced first, as a parent thread may have
+    held one when forking.
+
+    Runs automatically where os.register_at_fork is available (Python 3.7+).
+    Otherwise, call from the server's post-fork hook, e.g. for gunicorn:
+      def post_fork(server, worker):
+          from ssl_pki.ssl_session import reset_after_fork
+          reset_after_fork()
+    """
+    global _pki_files_lock
+    # Locks first; a parent thread may have held one when forking
+    reset_ssl_context_cache_lock()
+    reset_proxy_manager_cache_lock()
+    response_cache.reset_lock()
+    coalescer.reset_lock()
+    _pki_files_lock = threading.Lock()
+    https_client._mount_lock = threading.RLock()
+    adapters = list(https_client.adapters.values())
+    for adptr in adapters:
+        if getattr(adptr, 'hedge_policy', None) is not None:
+            adptr.hedge_policy.reset_lock()
+        if getattr(adptr, 'bulkhead', None) is not None:
+            adptr.bulkhead.reset()
+    reset_pools_after_fork()
+    for adptr in adapters:
+        adptr.close()
+    logger.debug(u'https_client connection pools reset after fork, pid: {0}'
+                 .format(os.getpid()))
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
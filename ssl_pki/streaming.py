@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2018 Boundless Spatial
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+import zlib
+import logging
+import tempfile
+
+from requests.exceptions import RequestException
+from urllib3.exceptions import HTTPError
+
+from .settings import STREAM_CHUNK_SIZE, SPOOL_MAX_MEMORY, SPOOL_DIR
+
+
+logger = logging.getLogger(__name__)
+
+
+def decoded_body(data, encoding):
+    """
+    Decompress a response body, e.g. relayed raw, for inspection
+    :param data: Body bytes
+    :param encoding: Content-Encoding of body, if any
+    :return: Decompressed body, or None if encoding is not supported
+    :rtype: str | None
+    """
+    encoding = (encoding or '').strip().lower()
+    try:
+        if encoding in ('', 'identity'):
+            return data
+        if encoding == 'gzip':
+            return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        if encoding == 'deflate':
+            try:
+                return zlib.decompress(data)
+            except zlib.error:
+                # Some servers send raw deflate, without the zlib header
+                return zlib.decompress(data, -zlib.MAX_WBITS)
+    except zlib.error as e:
+        logger.debug(u'Could not decode {0} content: {1}'.format(encoding, e))
+    return None
+
+
+def spool_body(response, decode_content=True, max_memory=None,
+               chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Read a (stream=True) upstream response body into a spooled temporary
+    file, held in memory up to max_memory bytes and spilled to disk beyond,
+    so reading a body of any size takes bounded memory
+    :type response: requests.Response
+    :param decode_content: Whether to decompress a body with a gzip or deflate
+        Content-Encoding, or read its raw bytes
+    :return: File, at its start, and body size; the body is in memory if its
+        size is at most max_memory
+    :rtype: (tempfile.SpooledTemporaryFile, int)
+    """
+    if max_memory is None:
+        max_memory = SPOOL_MAX_MEMORY
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory,
+                                          prefix='ssl_pki-', dir=SPOOL_DIR)
+    size = 0
+    try:
+        if decode_content:
+            chunks = response.iter_content(chunk_size)
+        else:
+            chunks = response.raw.stream(chunk_size, decode_content=False)
+        for chunk in chunks:
+            spool.write(chunk)
+            size += len(chunk)
+    except Exception:
+        spool.close()
+        raise
+    finally:
+        response.close()
+    spool.seek(0)
+    return spool, size
+
+
+class RequestBodyTooLarge(Exception):
+    """A request body exceeded its maximum size"""
+    pass
+
+
+class UpstreamBodyIncomplete(Exception):
+    """An upstream response body could not be relayed in full"""
+    pass
+
+
+class RequestBody(object):
+    """
+    File-like, iterable view of a Django request's unread body, i.e. its WSGI
+    input, to pass as requests' data, so an upload is forwarded upstream as it
+    is read from the client, with constant memory.
+
+    requests sends it with chunked transfer encoding; see
+    :class:`SizedRequestBody` for a body of known length. It can only be read
+    once, so is not retried (see SslContextAdapter.send).
+
+    :param request: Django request, whose body has not been read yet, or its
+        (terminated) WSGI input
+    :type request: django.http.HttpRequest | file
+    :param max_size: Maximum bytes to read, or 0 for no limit
+    :param chunk_size: Bytes per chunk, when iterated
+    """
+    def __init__(self, request, max_size=0, chunk_size=STREAM_CHUNK_SIZE):
+        self.request = request
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.request.read(size) if size is not None and size >= 0 \
+            else self.request.read()
+        self.bytes_read += len(data)
+        if self.max_size and self.bytes_read > self.max_size:
+            raise RequestBodyTooLarge(
+                'Request body exceeds {0} bytes'.format(self.max_size))
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class SizedRequestBody(RequestBody):
+    """
+    :class:`RequestBody` of known length, e.g. from the client's
+    Content-Length, which requests then sends upstream as is
+
+    :param length: Body length in bytes
+    """
+    def __init__(self, request, length, **kwargs):
+        super(SizedRequestBody, self).__init__(request, **kwargs)
+        self.length = length
+
+    def __len__(self):
+        return max(0, self.length - self.bytes_read)
+
+
+class UpstreamBody(object):
+    """
+    Iterable relaying a (stream=True) upstream response body in fixed-size
+    chunks, e.g. as a StreamingHttpResponse's content.
+
+    The upstream response is closed once its body is exhausted, or when the
+    iterable is closed, e.g. by Django, when the client disconnects. Upstream
+    errors, or passing the deadline, mid-body can no longer change the
+    response status, so they are logged and raise
+    :class:`UpstreamBodyIncomplete`, for the WSGI server to abort the
+    connection, rather than end a chunked (or unknown-length) body as if it
+    were complete.
+
+    :param response: Upstream response, requested with stream=True
+    :type response: requests.Response
+    :param chunk_size: Bytes per chunk
+    :param deadline: Optional time.time() by which the body must be relayed
+    :param decode_content: Whether to decompress a body with a gzip or deflate
+        Content-Encoding, or relay its raw bytes
+    :param on_close: Optional callable, called once the body is closed
+    """
+    def __init__(self, response, chunk_size=STREAM_CHUNK_SIZE, deadline=None,
+                 decode_content=True, on_close=None):
+        self.response = response
+        self.on_close = on_close
+        self.chunk_size = chunk_size
+        self.deadline = deadline
+        self.decode_content = decode_content
+        self.bytes_sent = 0
+        self.closed = False
+
+    def _chunks(self):
+        if self.decode_content:
+            return self.response.iter_content(self.chunk_size)
+        return self.response.raw.stream(self.chunk_size, decode_content=False)
+
+    def __iter__(self):
+        try:
+            for chunk in self._chunks():
+                if not chunk:
+                    continue
+                self.bytes_sent += len(chunk)
+                yield chunk
+                if self.deadline is not None and time.time() > self.deadline:
+                    logger.warn(u'Upstream body relay passed its deadline, '
+                                u'after {0} bytes: {1}'
+                                .format(self.bytes_sent, self.response.url))
+                    raise UpstreamBodyIncomplete(
+                        'Deadline passed after {0} bytes'
+                        .format(self.bytes_sent))
+        except (RequestException, HTTPError) as e:
+            logger.warn(u'Upstream body relay failed, after {0} bytes: {1} '
+                        u'({2})'.format(self.bytes_sent, self.response.url, e))
+            raise UpstreamBodyIncomplete(
+                'Upstream failed after {0} bytes: {1}'
+                .format(self.bytes_sent, e))
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.response.close()
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
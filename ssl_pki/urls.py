@@ -19,8 +19,10 @@
 #########################################################################
 
 from django.conf.urls import patterns, url
-from .views import pki_request
+from .views import pki_request, pki_batch, pki_pool_stats
 
 urlpatterns = patterns(
     '',
-    url(r'^pki/(?P<resource_url>.*)$', pki_request, name="pki_request"),)
+    url(r'^pki/(?P<resource_url>.*)$', pki_request, name="pki_request"),
+    url(r'^pki_batch/?$', pki_batch, name="pki_batch"),
+    url(r'^pki_stats/pools/?$', pki_pool_stats, name="pki_pool_stats"),)
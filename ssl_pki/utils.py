@@ -33,6 +33,25 @@ from .settings import get_pki_dir
 
 logger = logging.getLogger(__name__)
 
+# Conditional and cache request headers passed through upstream, by the /pki/
+# view and nginx offload, so clients can revalidate their cached copies, as
+# (header, request.META key)
+CONDITIONAL_HEADERS = [
+    ('If-None-Match', 'HTTP_IF_NONE_MATCH'),
+    ('If-Modified-Since', 'HTTP_IF_MODIFIED_SINCE'),
+    ('If-Match', 'HTTP_IF_MATCH'),
+    ('If-Unmodified-Since', 'HTTP_IF_UNMODIFIED_SINCE'),
+    ('Cache-Control', 'HTTP_CACHE_CONTROL'),
+    ('Pragma', 'HTTP_PRAGMA'),
+]
+
+# Byte-range request headers passed through upstream, e.g. for resumed
+# downloads or cloud-optimized GeoTIFF reads, as (header, request.META key)
+RANGE_HEADERS = [
+    ('Range', 'HTTP_RANGE'),
+    ('If-Range', 'HTTP_IF_RANGE'),
+]
+
 
 def protocol_relative_url(url):
     return url.startswith('//') or url.startswith(u'//')
@@ -70,17 +89,86 @@ def relative_to_absolute_url(url, scheme='https'):
     return url
 
 
+# Optional scheme, then netloc, of an absolute or protocol relative URL
+_netloc_regex = re.compile(r'^(?:[A-Za-z][A-Za-z0-9+.\-]*:)?//([^/?#]*)')
+
+
 def normalize_hostname(url):
     """
     Replace url with same URL, but with lowercased hostname
     :param url: A URL
     :rtype: basestring
     """
-    parts = urlparse(url)
-    return re.sub(parts.hostname, parts.hostname, url, count=1, flags=re.I)
+    if isinstance(url, ParsedUrl):
+        return url.url
+    m = _netloc_regex.match(url)
+    if m is None:
+        return url
+    # Skip any user:pass@, which is case-sensitive
+    start = m.start(1) + m.group(1).rfind('@') + 1
+    host = url[start:m.end(1)]
+    lower = host.lower()
+    if host == lower:
+        return url
+    return url[:start] + lower + url[m.end(1):]
+
+
+class ParsedUrl(object):
+    """
+    A URL parsed once, with its hostname lowercased, along with the parts
+    used to find its session adapter and hostname:port mapping.
+
+    Pass one along the request path, instead of the URL string, so the URL is
+    not re-parsed by each function on it.
+
+    :param url: An absolute URL
+    """
+    __slots__ = ('url', 'scheme', 'hostname', 'port', 'hostname_port',
+                 'base_url')
+
+    def __init__(self, url):
+        self.url = normalize_hostname(url)
+        parts = urlsplit(self.url)
+        self.scheme = parts.scheme
+        self.hostname = parts.hostname
+        self.port = parts.port
+        self.hostname_port = u"{0}{1}".format(
+            self.hostname, u":{0}".format(self.port) if self.port else '')
+        self.base_url = u"{0}://{1}".format(self.scheme, self.hostname_port)
+
+    def __str__(self):
+        return str(self.url)
+
+    def __unicode__(self):
+        return unicode(self.url)  # noqa
+
+    def __repr__(self):
+        return 'ParsedUrl({0!r})'.format(self.url)
+
+    def __eq__(self, other):
+        return isinstance(other, ParsedUrl) and self.url == other.url
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.url)
+
+
+def parse_url(url, scheme='https'):
+    """
+    :param url: Any URL, or a ParsedUrl (returned as is)
+    :param scheme: See protocol_relative_to_scheme
+    :rtype: ParsedUrl
+    """
+    if isinstance(url, ParsedUrl):
+        return url
+    return ParsedUrl(relative_to_absolute_url(url, scheme=scheme))
 
 
 def hostname_port(url):
+    if isinstance(url, ParsedUrl):
+        return url.hostname_port
     parts = urlparse(url)
     port = parts.port
     return u"{0}{1}".format(parts.hostname,
@@ -88,8 +176,9 @@ def hostname_port(url):
 
 
 def requests_base_url(url):
-    parts = urlparse(url)
-    return u"{0}://{1}".format(parts.scheme, hostname_port(url))
+    if isinstance(url, ParsedUrl):
+        return url.base_url
+    return ParsedUrl(url).base_url
 
 
 def pki_prefix():
@@ -18,28 +18,357 @@
 #
 #########################################################################
 
-import json
+import time
 import logging
 
-from urllib import unquote, urlencode
+from urllib import unquote
 # noinspection PyCompatibility
-from urlparse import parse_qsl, urlsplit
+from urlparse import urlsplit
+
+from requests.exceptions import Timeout, ConnectionError
+from urllib3.exceptions import ReadTimeoutError, ConnectTimeoutError
 
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.http.request import validate_host
+from django.utils.cache import patch_vary_headers
 from wsgiref import util as wsgiref_util
 
-try:
-    from logtailer.utils import logging_timer_expired
-except ImportError:
-    logging_timer_expired = None
-
-from .ssl_session import https_client
+from .cache import (
+    CACHEABLE_STATUSES,
+    CachedResponse,
+    response_cache,
+    freshness_lifetime,
+    parse_cache_control,
+    vary_names,
+)
+from .batch import (
+    BatchError,
+    parse_batch,
+    read_body,
+    item_record,
+    response_record,
+    ndjson,
+    strip_access_token,
+)
+from .bulkhead import BulkheadFull
+from .coalesce import coalescer
+from .compression import (
+    COMPRESSIBLE_STATUSES,
+    CompressedBody,
+    accepted_encoding,
+    compress,
+    compressible,
+    compression_settings,
+)
+from .models import compression_options, response_cache_options
+from .nginx import offload_route
+from .request_log import RequestLog
+from .settings import (
+    OFFLOAD,
+    BUFFER_MAX_SIZE,
+    RESPONSE_CACHE_MAX_ENTRY_SIZE,
+    PASSTHROUGH_ENCODING,
+    STREAM_REQUEST_BODY,
+    REQUEST_BODY_MAX_SIZE,
+    SPOOL_MAX_MEMORY,
+)
+from .ssl_adapter import min_timeout
+from .ssl_session import https_client, pool_stats
+from .streaming import (
+    UpstreamBody,
+    RequestBody,
+    SizedRequestBody,
+    RequestBodyTooLarge,
+    spool_body,
+)
+from .utils import CONDITIONAL_HEADERS, RANGE_HEADERS
 
 logger = logging.getLogger(__name__)
 
+# Optional client request header, in seconds, e.g. 'X-Pki-Deadline: 2.5'.
+# It can only shorten the timeouts configured for the upstream's SslConfig.
+DEADLINE_HEADER = 'HTTP_X_PKI_DEADLINE'
+
+
+# Response headers relayed with a 304 Not Modified (lowercase)
+NOT_MODIFIED_HEADERS = ['cache-control', 'content-location', 'date', 'etag',
+                        'expires', 'last-modified', 'vary']
+
+
+def _request_deadline(request):
+    """
+    :type request: django.http.HttpRequest
+    :return: Client-supplied deadline in seconds, if any and valid
+    :rtype: float | None
+    """
+    value = request.META.get(DEADLINE_HEADER, None)
+    if value is None:
+        return None
+    try:
+        deadline = float(value)
+    except ValueError:
+        deadline = 0
+    if deadline <= 0:
+        logger.debug(u'Ignoring invalid deadline header value: {0}'
+                     .format(value))
+        return None
+    return deadline
+
+
+def _is_timeout(error):
+    """Whether a requests error was caused by a connect or read timeout"""
+    if isinstance(error, Timeout):
+        return True
+    # Timeouts that exhaust urllib3 retries surface as ConnectionError
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (ReadTimeoutError, ConnectTimeoutError))
+
+
+def _buffer_response(req_res, content_type):
+    """
+    Whether to read a whole upstream response body before relaying it: only
+    textual ones (for inspection and logging) of a known, small size
+    :type req_res: requests.Response
+    :rtype: bool
+    """
+    if not any([t in content_type.lower() for t in ['text', 'json', 'xml']]):
+        return False
+    try:
+        length = int(req_res.headers.get('Content-Length', ''))
+    except ValueError:
+        return False  # unknown, e.g. chunked
+    return length <= BUFFER_MAX_SIZE
+
+
+def _request_body(request):
+    """
+    Body to forward upstream: a stream over the client's unread body, if
+    enabled, so large uploads are not held in memory; otherwise, the body.
+    A chunked body is only streamed when the WSGI server de-chunks it (and
+    sets wsgi.input_terminated), as Django reads none of it.
+    :type request: django.http.HttpRequest
+    :raises RequestBodyTooLarge: If Content-Length exceeds the limit
+    :rtype: str | RequestBody
+    """
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0) or None
+    except ValueError:
+        length = None
+    if REQUEST_BODY_MAX_SIZE and length and length > REQUEST_BODY_MAX_SIZE:
+        raise RequestBodyTooLarge(
+            'Request body exceeds {0} bytes'.format(REQUEST_BODY_MAX_SIZE))
+    if (STREAM_REQUEST_BODY and
+            request.method in ('POST', 'PUT', 'PATCH') and
+            not getattr(request, '_read_started', True)):
+        if length is not None:
+            return SizedRequestBody(request, length,
+                                    max_size=REQUEST_BODY_MAX_SIZE)
+        if ('chunked' in request.META.get('HTTP_TRANSFER_ENCODING', '') and
+                request.META.get('wsgi.input_terminated')):
+            # Django caps its stream at CONTENT_LENGTH, i.e. 0 here, so read
+            # the WSGI input, which the server de-chunks and terminates
+            return RequestBody(request.META['wsgi.input'],
+                               max_size=REQUEST_BODY_MAX_SIZE)
+    return request.body
+
+
+def _bypass_cache(request):
+    """Whether the client asked for a response that is not from a cache"""
+    cc = parse_cache_control(request.META.get('HTTP_CACHE_CONTROL'))
+    if 'no-cache' in cc or 'no-store' in cc or cc.get('max-age') == '0':
+        return True
+    return 'no-cache' in request.META.get('HTTP_PRAGMA', '').lower()
+
+
+def _cache_lifetime(req_res, cache_ttl):
+    """
+    Seconds to cache an upstream response, if it may be cached (or shared
+    with coalesced requests) once read
+    :type req_res: requests.Response
+    :rtype: int | float | None
+    """
+    if req_res.status_code not in CACHEABLE_STATUSES:
+        return None
+    try:
+        length = int(req_res.headers.get('Content-Length', ''))
+    except ValueError:
+        return None  # unknown, e.g. chunked
+    if length > RESPONSE_CACHE_MAX_ENTRY_SIZE:
+        return None
+    lifetime = freshness_lifetime(req_res.headers, ttl=cache_ttl)
+    if not lifetime and cache_ttl is None and (
+            'ETag' in req_res.headers or 'Last-Modified' in req_res.headers):
+        return 0  # stored, to be revalidated upon each use
+    return lifetime or None
+
+
+def _cached_response(request, entry):
+    """
+    Response from the response cache, or 304 if client has it already
+    :type entry: CachedResponse
+    :rtype: HttpResponse
+    """
+    if entry.not_modified(request.META.get('HTTP_IF_NONE_MATCH'),
+                          request.META.get('HTTP_IF_MODIFIED_SINCE')):
+        response = _not_modified_response(entry.headers)
+    else:
+        response = HttpResponse(
+            content=entry.content if request.method != 'HEAD' else b'',
+            status=entry.status,
+            reason=entry.reason,
+        )
+        for h, v in entry.headers:
+            response[h] = v
+    response['Age'] = str(int(entry.age()))
+    response['X-Pki-Cache'] = 'HIT'
+    return response
+
+
+def _not_modified_response(headers):
+    """
+    304 Not Modified, with no body, and only the headers allowed with it
+    :param headers: (header, value) pairs of the (upstream) response
+    :rtype: HttpResponse
+    """
+    response = HttpResponse(status=304)
+    del response['Content-Type']
+    for h, v in headers:
+        if h.lower() in NOT_MODIFIED_HEADERS:
+            response[h] = v
+    return response
+
+
+def _offload_response(route):
+    """
+    Empty response, handing the request to nginx, which fetches the upstream
+    resource itself
+    :param route: Internal nginx URI, see nginx.offload_route
+    :rtype: HttpResponse
+    """
+    response = HttpResponse()
+    del response['Content-Type']  # upstream's is used
+    response['X-Accel-Redirect'] = route
+    return response
+
+
+def _too_large_response(error):
+    """:rtype: HttpResponse"""
+    logger.warn(u'PKI view request body too large: {0}'.format(error))
+    return HttpResponse('{0}.'.format(error),
+                        status=413,
+                        content_type='text/plain')
+
+
+def _busy_response(url, start, error):
+    """
+    Service unavailable response, for requests refused by an upstream's
+    concurrency limit (see SslConfig max concurrent requests)
+    :type error: BulkheadFull
+    :rtype: HttpResponse
+    """
+    elapsed = time.time() - start
+    logger.warn(u'PKI view upstream busy, after {0:.3f}s: {1} ({2})'
+                .format(elapsed, url, error))
+    response = HttpResponse(
+        'Remote service has too many requests in progress; {0}.'
+        .format(error),
+        status=503,
+        content_type='text/plain'
+    )
+    response['Retry-After'] = '1'
+    response['X-Pki-Elapsed'] = '{0:.3f}'.format(elapsed)
+    return response
+
+
+def _compressed_response(request, response):
+    """
+    Compress an uncompressed, textual response of a GET, if the client
+    accepts it, and the upstream's SslConfig (or PKI_COMPRESS_LEVEL) enables
+    compression
+    :type response: django.http.HttpResponseBase
+    :rtype: django.http.HttpResponseBase
+    """
+    url = getattr(request, 'pki_upstream_url', None)
+    if (url is None or request.method != 'GET' or
+            response.status_code not in COMPRESSIBLE_STATUSES or
+            response.has_header('Content-Encoding') or
+            response.has_header('Content-Range') or
+            not compressible(response.get('Content-Type')) or
+            'no-transform' in parse_cache_control(
+                response.get('Cache-Control'))):
+        return response
+    level, min_size = compression_settings(*compression_options(url))
+    if not level:
+        return response
+    # Body depends on Accept-Encoding, even when not compressed
+    patch_vary_headers(response, ['Accept-Encoding'])
+    encoding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+    if encoding is None:
+        return response
+    if response.streaming:
+        try:
+            length = int(response.get('Content-Length'))
+        except (TypeError, ValueError):
+            length = None  # unknown, e.g. chunked; likely large
+        if length is not None and length < min_size:
+            return response
+        response.streaming_content = CompressedBody(
+            response.streaming_content, encoding, level)
+        # Not to be sent as is, by a wsgi.file_wrapper
+        response.file_to_stream = None
+        del response['Content-Length']
+    else:
+        if len(response.content) < min_size:
+            return response
+        response.content = compress(response.content, encoding, level)
+        response['Content-Length'] = str(len(response.content))
+    response['Content-Encoding'] = encoding
+    etag = response.get('ETag')
+    if etag and not etag.startswith('W/'):
+        # Compressed bytes differ from the upstream's representation
+        response['ETag'] = 'W/' + etag
+    return response
+
+
+def _detach_bulkhead_release(request):
+    """
+    Hand over the release of a request's upstream concurrency slot, if held
+    :return: Callable releasing it, or None
+    """
+    bulkhead = getattr(request, 'pki_bulkhead', None)
+    request.pki_bulkhead = None
+    return bulkhead.release if bulkhead is not None else None
+
+
+def _timeout_response(url, start, deadline, error=None):
+    """
+    Distinct gateway timeout response, with timing information
+    :rtype: HttpResponse
+    """
+    elapsed = time.time() - start
+    logger.warn(u'PKI view upstream timed out after {0:.3f}s: {1} ({2})'
+                .format(elapsed, url, error or 'deadline exceeded'))
+    response = HttpResponse(
+        'Remote service timed out after {0:.3f} seconds{1}.'.format(
+            elapsed,
+            ' (requested deadline: {0} seconds)'.format(deadline)
+            if deadline is not None else ''),
+        status=504,
+        content_type='text/plain'
+    )
+    response['X-Pki-Elapsed'] = '{0:.3f}'.format(elapsed)
+    if deadline is not None:
+        response['X-Pki-Deadline'] = str(deadline)
+    return response
+
 
 @login_required
 def pki_request(request, resource_url=None):
@@ -50,8 +379,29 @@ def pki_request(request, resource_url=None):
     :param resource_url: Remainder of parsed path, e.g. '/pki/<resource_url>'
     :rtype: HttpResponse
     """
+    log = RequestLog(request.method, log=logger)
+    try:
+        response = _pki_request(request, resource_url, log)
+    finally:
+        flight = getattr(request, 'pki_flight', None)
+        if flight is not None:
+            # Wake coalesced requests, sharing any result, even upon errors
+            coalescer.finish(flight)
+        release = _detach_bulkhead_release(request)
+        if release is not None:
+            release()
+    response = _compressed_response(request, response)
+    log.emit(response)
+    return response
+
 
-    # Limit to allowed host calls, e.g. when coming from local Py packages
+def _host_denied(request, log):
+    """
+    Limit to allowed host calls, e.g. when coming from local Py packages
+    :type log: RequestLog
+    :return: Forbidden response, if host is missing or not allowed
+    :rtype: HttpResponse | None
+    """
     req_host = request.get_host()
     if not req_host:
         return HttpResponse(
@@ -61,34 +411,29 @@ def pki_request(request, resource_url=None):
         )
     else:
         req_host = req_host.split(':')[0]  # remove any port
-    logger.debug("request host: {0}".format(req_host))
+    log.detail('request host', req_host)
     site_url = urlsplit(settings.SITEURL)
     exch_url = urlsplit(settings.SITE_LOCAL_URL)
     allowed_hosts = [
         'localhost', '127.0.0.1', '[::1]', 'testserver',
         site_url.hostname, exch_url.hostname
     ]
-    logger.debug("allowed_hosts: {0}".format(allowed_hosts))
+    log.detail('allowed_hosts', allowed_hosts)
     if not validate_host(req_host, allowed_hosts):
         return HttpResponse(
             "Host requesting service is not allowed.",
             status=403,
             content_type="text/plain"
         )
+    return None
 
-    if not resource_url:
-        return HttpResponse('Resource URL missing for PKI request',
-                            status=400,
-                            content_type='text/plain')
-
-    logger.info("PKI view starting with resource url: {0}"
-                .format(resource_url))
 
-    # Manually copy over headers, skipping unwanted ones
-    logger.info("PKI view request.COOKIES: {0}"
-                .format(request.COOKIES))
-    logger.info("PKI view request.META: {0}"
-                .format(request.META))
+def _upstream_headers(request):
+    """
+    Manually copy over headers to send upstream, skipping unwanted ones
+    :type request: django.http.HttpRequest
+    :rtype: dict
+    """
     # IMPORTANT: Don't pass any cookies or OAuth2 headers to remote resource
     headers = {}
     if request.method in ("POST", "PUT") and "CONTENT_TYPE" in request.META:
@@ -103,6 +448,14 @@ def pki_request(request, resource_url=None):
     for accept, http_accept in zip(accepts, http_accepts):
         if http_accept in request.META:
             headers[accept] = request.META[http_accept]
+    for header, meta_key in CONDITIONAL_HEADERS + RANGE_HEADERS:
+        if meta_key in request.META:
+            headers[header] = request.META[meta_key]
+    if ((PASSTHROUGH_ENCODING or 'Range' in headers) and
+            'Accept-Encoding' not in headers):
+        # Otherwise requests asks for gzip, which client may not accept, and
+        # a range of which could not be decoded
+        headers['Accept-Encoding'] = 'identity'
 
     # TODO: Passthru HTTP_REFERER?
 
@@ -113,51 +466,164 @@ def pki_request(request, resource_url=None):
     if auth_header and 'bearer' in auth_header.lower():
         del request.META['HTTP_AUTHORIZATION']
 
+    return headers
+
+
+def _upstream_url(request, resource_url):
+    """
+    Turn the remainder of path back into original URL
+    :type request: django.http.HttpRequest
+    :return: URL, and its query string (if any)
+    :rtype: (str, str | None)
+    """
     # Strip our bearer token token from query params!
     # TODO: Migrate to request.GET QueryDict parsing?
     #       Unsure if keep_blank_values and doseq are supported
     query_str = request.META['QUERY_STRING']
     query = None
     if query_str != '':
-        # Keep keys with empty values and maintain order
-        params = parse_qsl(query_str.strip(), keep_blank_values=True)
-        clean_params = [(k, v) for k, v in params if
-                        k.lower() != 'access_token']
-        query = urlencode(clean_params, doseq=True)
+        query = strip_access_token(query_str)
 
-    # Turn the remainder of path back into original URL
     r_url = unquote(resource_url)
     # NOTE: Since no origin scheme is recorded (could be in rewritten pki
     # proxy path), assume https
     url = 'https://' + r_url + (('?' + query) if query else '')
+    return url, query
 
-    logger.info("PKI view starting remote connection to url: {0}".format(url))
 
-    # Do remote request
-    logger.info("PKI view 'requests' request headers:\n{0}"
-                .format(headers))
-    req_res = https_client.request(
-        method=request.method,
-        url=url,
-        headers=headers,
-        data=request.body,
-    )
-    """:type: requests.Response"""
+def _pki_request(request, resource_url, log):
+    """
+    :type log: RequestLog
+    :rtype: HttpResponse
+    """
+    denied = _host_denied(request, log)
+    if denied is not None:
+        return denied
 
-    if not req_res:
-        return HttpResponse('Remote service did not return content.',
+    if not resource_url:
+        return HttpResponse('Resource URL missing for PKI request',
                             status=400,
                             content_type='text/plain')
 
+    log.headers('request.META', request.META)
+    headers = _upstream_headers(request)
+    url, query = _upstream_url(request, resource_url)
+    request.pki_upstream_url = url
+
+    log.set(url=url)
+
+    # nginx changes other methods to GET upon X-Accel-Redirect
+    if OFFLOAD and request.method in ('GET', 'HEAD'):
+        route = offload_route(url)
+        if route is not None:
+            log.set(offload=route)
+            return _offload_response(route)
+
+    # Optional client deadline; only shortens configured SslConfig timeouts
+    deadline = _request_deadline(request)
+
+    # Serve GET and HEAD from response cache, if enabled and not refused
+    cache_key = None
+    ssl_config_id = cache_ttl = None
+    # Stale cached response, being revalidated with upstream
+    stale = None
+    # Partial (Range) requests are neither served from nor stored in the
+    # cache, nor coalesced
+    if ((response_cache.enabled or coalescer.enabled) and
+            request.method in ('GET', 'HEAD') and 'Range' not in headers):
+        ssl_config_id, cache_ttl = response_cache_options(url)
+        if cache_ttl != 0:
+            cache_key = response_cache.primary_key(url, ssl_config_id)
+        if (cache_key is not None and response_cache.enabled and
+                not _bypass_cache(request)):
+            entry = response_cache.lookup(cache_key, headers)
+            if entry is not None and entry.is_fresh():
+                return _cached_response(request, entry)
+            if entry is not None and not any(
+                    [h in headers for h in entry.validators()]):
+                # Upstream can then skip resending the body, if unchanged
+                stale = entry
+                headers.update(entry.validators())
+
+    # Wait for an identical GET in flight, instead of fetching it again
+    flight = None
+    if cache_key is not None and request.method == 'GET' and \
+            coalescer.enabled:
+        flight, leader = coalescer.join(
+            (cache_key, tuple(sorted(headers.items()))))
+        if leader:
+            request.pki_flight = flight
+        else:
+            entry = coalescer.wait(flight, timeout=deadline)
+            flight = None
+            if entry is not None:
+                response = _cached_response(request, entry)
+                response['X-Pki-Cache'] = 'COALESCED'
+                return response
+            # Leader had no shareable response; fetch as if not coalesced
+
+    # Limit requests in flight to the upstream, per its SslConfig
+    start = time.time()
+    bulkhead = https_client.upstream_bulkhead(url)
+    if bulkhead is not None:
+        try:
+            bulkhead.acquire(timeout=deadline)
+        except BulkheadFull as e:
+            return _busy_response(url, start, e)
+        request.pki_bulkhead = bulkhead
+    timeout = deadline
+    if deadline is not None:
+        # Time spent queued counts toward the deadline
+        timeout = max(deadline - (time.time() - start), 0.001)
+
+    # Do remote request
+    log.headers("'requests' request headers", headers)
+    try:
+        req_res = https_client.request(
+            method=request.method,
+            url=url,
+            headers=headers,
+            data=_request_body(request),
+            timeout=timeout,
+            stream=True,
+        )
+        """:type: requests.Response"""
+    except RequestBodyTooLarge as e:
+        return _too_large_response(e)
+    except (Timeout, ConnectionError) as e:
+        if not _is_timeout(e):
+            raise
+        return _timeout_response(url, start, deadline, e)
+
+    if deadline is not None and time.time() - start > deadline:
+        req_res.close()
+        return _timeout_response(url, start, deadline)
+
+    if stale is not None and req_res.status_code == 304:
+        req_res.close()
+        try:
+            age = int(req_res.headers.get('Age', 0))
+        except ValueError:
+            age = 0
+        entry = response_cache.revalidate(
+            cache_key, headers, stale, req_res.headers.items(),
+            ttl=cache_ttl, age=age)
+        if flight is not None:
+            flight.result = entry
+        response = _cached_response(request, entry)
+        response['X-Pki-Cache'] = 'REVALIDATED'
+        return response
+
     # TODO: Capture errors and signal to web UI for reporting to user.
     #       Don't let errors just raise exceptions
 
-    logger.info("PKI view 'requests' response status code: {0}"
-                .format(req_res.status_code))
-    logger.info("PKI view 'requests' response headers:\n{0}"
-                .format(req_res.headers))
+    log.set(upstream_status=req_res.status_code)
+    log.headers("'requests' response headers", req_res.headers)
+
+    # Partial content is relayed as is, e.g. multipart/byteranges bodies
+    partial = req_res.status_code == 206
 
-    if query and ('f=pjson' in query or 'f=json' in query):
+    if query and ('f=pjson' in query or 'f=json' in query) and not partial:
         # Sometimes arcrest servers don't return proper content type
         content_type = 'application/json'
     elif 'Content-Type' in req_res.headers:
@@ -166,9 +632,20 @@ def pki_request(request, resource_url=None):
         content_type = 'text/plain'
 
     req_transfer_encodings = ['gzip', 'deflate']
-
+    # Whether body is decompressed by requests, instead of relayed as is
+    # Ranges are of the encoded body, so partial bodies are never decoded
+    decoded = not PASSTHROUGH_ENCODING and not partial
+    # Seconds to cache the response for, if it is to be stored
+    cache_lifetime = None
+    if cache_key is not None and request.method == 'GET':
+        cache_lifetime = _cache_lifetime(req_res, cache_ttl)
+
+    if req_res.status_code == 304:
+        # Client's conditional request matched; it keeps its cached copy
+        response = _not_modified_response(req_res.headers.items())
+        req_res.close()
     # If we get a redirect, beyond # allowed in config, add a useful message.
-    if req_res.status_code in (301, 302, 303, 307):
+    elif req_res.status_code in (301, 302, 303, 307):
         response = HttpResponse(
             'This proxy does not support more than the configured redirects. '
             'The server in "{0}" asked for this recent redirect: "{1}"'
@@ -177,33 +654,63 @@ def pki_request(request, resource_url=None):
             content_type=content_type
         )
         response['Location'] = req_res.headers['Location']
-    else:
-        # logger.debug("pki requests response content (first 2000 chars):\n{0}"
-        #              .format(req_res.content[:2000]))
-        txt_content = 'Not textual content'
-        txt_types = ['text', 'json', 'xml']
-        if any([t in content_type.lower() for t in txt_types]):
-            txt_content = req_res.content
-            # Format JSON as needed for client log output
-            if ('json' in content_type.lower() and
-                    logger.getEffectiveLevel() <= logging.INFO and
-                    callable(logging_timer_expired) and
-                    not logging_timer_expired()):
-                txt_content = json.dumps(json.loads(txt_content), indent=2)
-
-        logger.info("PKI view 'requests' response content:\n{0}"
-                    .format(txt_content))
-
-        if req_res.headers.get('content-encoding') in req_transfer_encodings:
-            # Change content length to reflect requests auto-decompression
-            req_res.headers['content-length'] = len(req_res.content)
-
-        response = HttpResponse(
-            content=req_res.content,
+        req_res.close()
+    elif (cache_lifetime is None and
+            not _buffer_response(req_res, content_type)):
+        # Relay large or binary bodies as they arrive, without holding them
+        response = StreamingHttpResponse(
+            UpstreamBody(
+                req_res,
+                deadline=min_timeout(
+                    getattr(req_res, 'pki_deadline', None),
+                    start + deadline if deadline is not None else None),
+                decode_content=decoded,
+                # Upstream's slot is held until the body is relayed
+                on_close=_detach_bulkhead_release(request)),
             status=req_res.status_code,
             reason=req_res.reason,
             content_type=content_type,
         )
+        if (decoded and req_res.headers.get('content-encoding') in
+                req_transfer_encodings):
+            # Decompressed length is unknown until relayed
+            req_res.headers.pop('content-length', None)
+    else:
+        # Raw bytes are relayed as is; only decompressed for inspection, below
+        spool, size = spool_body(req_res, decode_content=decoded)
+
+        if (decoded and req_res.headers.get('content-encoding') in
+                req_transfer_encodings):
+            # Change content length to reflect requests auto-decompression
+            req_res.headers['content-length'] = size
+
+        if size > SPOOL_MAX_MEMORY:
+            # Spilled to disk, e.g. once decompressed; relay it from there,
+            # via the server's wsgi.file_wrapper (e.g. sendfile), if any
+            log.detail('response content', lambda: u'{0} bytes, spooled to '
+                                                   u'disk'.format(size))
+            response = FileResponse(
+                spool,
+                status=req_res.status_code,
+                reason=req_res.reason,
+                content_type=content_type,
+            )
+            response['Content-Length'] = str(size)
+            # Too large for the response cache, as decoded
+            cache_lifetime = None
+        else:
+            content = spool.read()
+            spool.close()
+
+            log.body(content, content_type, encoding=None if decoded else
+                     req_res.headers.get('content-encoding'))
+
+            response = HttpResponse(
+                content=content,
+                status=req_res.status_code,
+                reason=req_res.reason,
+                content_type=content_type,
+            )
 
     # TODO: Should we be sniffing encoding/charset and passing back?
 
@@ -213,18 +720,169 @@ def pki_request(request, resource_url=None):
         # ensure header is not passed through to client
         # http://docs.python-requests.org/en/master/user/quickstart/
         #   #binary-response-content
-        if hdr.lower() == 'content-encoding' and val in req_transfer_encodings:
+        if (decoded and hdr.lower() == 'content-encoding' and
+                val in req_transfer_encodings):
             return True
         return False
     skip_headers = ['content-type']  # add any as lowercase
-    for h, v in req_res.headers.items():
+    # A 304 already has the only headers allowed with it
+    passthru_headers = req_res.headers.items() \
+        if req_res.status_code != 304 else []
+    for h, v in passthru_headers:
         if h.lower() not in skip_headers \
                 and not skip_content_encoding(h, v) \
                 and not wsgiref_util.is_hop_by_hop(h)\
                 and h not in response:
             response[h] = v
 
-    logger.info("PKI view Django response headers:\n{0}"
-                .format(response.serialize_headers()))
+    if cache_lifetime is not None:
+        try:
+            age = int(req_res.headers.get('Age', 0))
+        except ValueError:
+            age = 0
+        entry = CachedResponse(
+            response.status_code,
+            response.reason_phrase,
+            response.items(),
+            response.content,
+            cache_lifetime,
+            age=age,
+            vary=vary_names(req_res.headers.get('Vary')),
+            ssl_config_id=ssl_config_id,
+        )
+        stored = response_cache.store(cache_key, headers, entry)
+        logger.debug(u"PKI view response {0}cached for {1}s: {2}".format(
+            '' if stored else 'not ', cache_lifetime, url))
+        if flight is not None:
+            flight.result = entry
+    if cache_key is not None and response_cache.enabled:
+        response['X-Pki-Cache'] = 'MISS'
+
+    log.headers('Django response headers', response.items())
 
     return response
+
+
+def _upstream_slot(req):
+    """
+    Concurrency slot of a batched request's upstream, held while it is
+    fetched, as for /pki/ requests (see SslConfig max concurrent requests)
+    :param req: Request kwargs
+    :return: Context manager, or None if the upstream has no limit
+    """
+    bulkhead = https_client.upstream_bulkhead(req['url'])
+    if bulkhead is None:
+        return None
+    return bulkhead.slot(timeout=req.get('timeout'))
+
+
+@login_required
+def pki_batch(request):
+    """
+    Fetch many resources, concurrently, for one authenticated request, e.g.
+    for print services. POST a JSON list of resource URLs, or of objects with
+    a 'url' and optional 'method' (GET or HEAD) and 'headers'.
+
+    Results are streamed as newline-delimited JSON, one object per resource,
+    as each completes: its 'index' in the list, 'url', 'method', 'status',
+    'reason', 'headers', 'elapsed' and 'body' (or 'body_base64', if not
+    textual), or an 'error'.
+    :param request: Django request object
+    :type request: django.http.HttpRequest
+    :rtype: HttpResponse
+    """
+    log = RequestLog(request.method, log=logger)
+    response = _pki_batch(request, log)
+    if not response.streaming:
+        # Streamed results are logged once relayed
+        log.emit(response)
+    return response
+
+
+def _pki_batch(request, log):
+    """
+    :type log: RequestLog
+    :rtype: HttpResponse
+    """
+    denied = _host_denied(request, log)
+    if denied is not None:
+        return denied
+    if request.method != 'POST':
+        response = HttpResponse('Batch requests must be POSTed.',
+                                status=405,
+                                content_type='text/plain')
+        response['Allow'] = 'POST'
+        return response
+    try:
+        items = parse_batch(request.body)
+    except BatchError as e:
+        return HttpResponse('{0}.'.format(e),
+                            status=400,
+                            content_type='text/plain')
+    log.set(url='batch', items=len(items))
+
+    deadline = _request_deadline(request)
+    reqs = []
+    indexes = []
+    for index, item in enumerate(items):
+        if 'error' not in item:
+            indexes.append(index)
+            reqs.append({
+                'method': item['method'],
+                'url': item['url'],
+                'headers': item['headers'],
+                'timeout': deadline,
+                'stream': True,
+            })
+
+    def records():
+        failed = len(items) - len(reqs)
+        sent = 0
+        try:
+            for index, item in enumerate(items):
+                if 'error' in item:
+                    line = ndjson(item_record(index, item, 400,
+                                              item['error']))
+                    sent += len(line)
+                    yield line
+            for result in https_client.iter_gather(reqs, process=read_body,
+                                                   guard=_upstream_slot):
+                index = indexes[result.index]
+                item = items[index]
+                if result.error is not None:
+                    error = result.error
+                    if isinstance(error, BulkheadFull):
+                        status = 503
+                    else:
+                        status = 504 if _is_timeout(error) else 502
+                    logger.warn(u'PKI batch request failed: {0} ({1})'
+                                .format(item['url'], error))
+                    failed += 1
+                    record = item_record(index, item, status, str(error))
+                else:
+                    req_res, content = result.response
+                    record = response_record(index, item, req_res, content,
+                                             elapsed=result.elapsed)
+                line = ndjson(record)
+                sent += len(line)
+                yield line
+        finally:
+            # Logged once results are relayed, or the client went away
+            log.set(failed=failed)
+            log.emit(response, bytes_sent=sent)
+
+    response = StreamingHttpResponse(records(),
+                                     content_type='application/x-ndjson')
+    return response
+
+
+@staff_member_required
+def pki_pool_stats(request):
+    """
+    Staff-only JSON snapshot of this process's https_client adapters and
+    connection pools
+    :param request: Django request object
+    :type request: django.http.HttpRequest
+    :rtype: JsonResponse
+    """
+    return JsonResponse(pool_stats())